@@ -1,23 +1,404 @@
 import os
+import io
+import sys
 import re
 import json
+import html
 import base64
+import asyncio
 import hashlib
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler, CallbackQueryHandler
+import contextlib
+import contextvars
+import time
+import socket
+import ipaddress
+import secrets
+import itertools
+import zipfile
+import tempfile
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+import httpx
+import metrics
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaDocument
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import Application, BaseRateLimiter, BaseUpdateProcessor, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler, CallbackQueryHandler
 
 # States for conversation
-TXT_FILE, PASSWORD, BATCH_NAME, CREDIT_NAME, CONFIRM = range(5)
+TXT_FILE, PASSWORD, BATCH_NAME, CREDIT_NAME, CONFIRM, APPEND_FILE = range(6)
 
 # Store user data temporarily
 user_data_store = {}
 
+# Self-hosted Bot API server (https://github.com/tdlib/telegram-bot-api)
+# Public API only serves downloads up to 20 MB; a local server started with
+# --local has no such limit and, in local mode, documents are read from its disk
+BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL')  # e.g. http://localhost:8081/bot
+BOT_API_BASE_FILE_URL = os.getenv('BOT_API_BASE_FILE_URL')  # default: derived from BOT_API_BASE_URL
+BOT_API_LOCAL_MODE = os.getenv('BOT_API_LOCAL_MODE', '').lower() in ('1', 'true', 'yes')
+
+# Upload limits (override with environment variables)
+MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', (200 if BOT_API_LOCAL_MODE else 20) * 1024 * 1024))
+SPOOL_MAX_MEMORY = int(os.getenv('SPOOL_MAX_MEMORY', 1024 * 1024))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+ALLOWED_MIME_TYPES = {
+    mime.strip().lower()
+    for mime in os.getenv('ALLOWED_MIME_TYPES', 'text/plain').split(',')
+    if mime.strip()
+}
+
+# Parser limits: longer lines are skipped, parsing one file stops after the time budget
+MAX_LINE_LENGTH = int(os.getenv('MAX_LINE_LENGTH', 10000))
+PARSE_TIME_BUDGET = float(os.getenv('PARSE_TIME_BUDGET', 30))
+
+# Bulk uploads: ZIP archives or several TXT files per conversation
+ZIP_MIME_TYPES = {'application/zip', 'application/x-zip-compressed'}
+MAX_BATCH_FILES = int(os.getenv('MAX_BATCH_FILES', 50))
+MAX_ZIP_UNCOMPRESSED = int(os.getenv('MAX_ZIP_UNCOMPRESSED', 5 * MAX_FILE_SIZE))
+
+# Concurrency and HTTP settings
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 64))
+CONNECTION_POOL_SIZE = int(os.getenv('CONNECTION_POOL_SIZE', 256))
+READ_TIMEOUT = float(os.getenv('READ_TIMEOUT', 30))
+WRITE_TIMEOUT = float(os.getenv('WRITE_TIMEOUT', 60))
+CONNECT_TIMEOUT = float(os.getenv('CONNECT_TIMEOUT', 10))
+POOL_TIMEOUT = float(os.getenv('POOL_TIMEOUT', 10))
+
+# Admission control: estimated bytes of downloads, parsed sessions and renders
+# kept under MEMORY_BUDGET, new work waits in a queue when it is reached
+MEMORY_BUDGET = int(os.getenv('MEMORY_BUDGET', 256 * 1024 * 1024))
+ADMISSION_TIMEOUT = float(os.getenv('ADMISSION_TIMEOUT', 300))  # seconds in queue before giving up
+# Memory estimates (measured with tracemalloc on large uploads)
+UPLOAD_MEMORY_FACTOR = 5  # peak bytes while downloading + parsing, per uploaded byte
+ZIP_EXPANSION_ESTIMATE = 8  # TXT bytes per compressed ZIP byte
+SESSION_BYTES_PER_ITEM = 500  # parsed item waiting in user_data_store
+RENDER_BYTES_PER_ITEM = 2048  # peak while encrypting, rendering and sending
+
+# Flood control for outgoing Bot API requests
+GLOBAL_RATE_LIMIT = float(os.getenv('GLOBAL_RATE_LIMIT', 30))  # requests per second
+GROUP_RATE_LIMIT = float(os.getenv('GROUP_RATE_LIMIT', 20))  # messages per minute per group
+FLOOD_MAX_RETRIES = int(os.getenv('FLOOD_MAX_RETRIES', 3))
+
+# Telegram file_id of already sent results, keyed by content + settings hash
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 1000))
+result_cache = OrderedDict()
+
+# Content-type probing for links without a known extension (off by default)
+PROBE_LINKS = os.getenv('PROBE_LINKS', '0') == '1'
+PROBE_CONCURRENCY = int(os.getenv('PROBE_CONCURRENCY', 20))
+PROBE_TIMEOUT = float(os.getenv('PROBE_TIMEOUT', 5))
+PROBE_CACHE_SIZE = int(os.getenv('PROBE_CACHE_SIZE', 10000))
+PROBE_MAX_REDIRECTS = 5
+# Links come from users: loopback, private and link-local targets are refused unless this is set
+PROBE_ALLOW_PRIVATE = os.getenv('PROBE_ALLOW_PRIVATE', '0') == '1'
+# host + path pattern -> detected type
+probe_cache = OrderedDict()
+
+# Video player: HLS module loaded by the viewer only on first .m3u8 playback
+HLS_JS_URL = os.getenv('HLS_JS_URL', 'https://cdn.jsdelivr.net/npm/hls.js@1/dist/hls.min.js')
+PRECONNECT_HOSTS = int(os.getenv('PRECONNECT_HOSTS', 3))
+# Decoded batches the viewer keeps in the browser's IndexedDB
+VIEWER_CACHE_ENTRIES = int(os.getenv('VIEWER_CACHE_ENTRIES', 20))
+# Characters per piece when HTML is rendered incrementally
+HTML_CHUNK_SIZE = int(os.getenv('HTML_CHUNK_SIZE', 65536))
+
+# Outputs selected by default on the confirm step (html, json, m3u)
+OUTPUT_FORMATS = [
+    fmt.strip().lower()
+    for fmt in os.getenv('OUTPUT_FORMATS', 'html').split(',')
+    if fmt.strip()
+]
+
+# Encrypted batches kept on disk so new links can be appended later
+BATCH_STORE_DIR = os.getenv('BATCH_STORE_DIR', 'batches')
+# Batches expire this many days after their last update, oldest go first above the size cap
+BATCH_TTL_DAYS = float(os.getenv('BATCH_TTL_DAYS', 30))
+BATCH_STORE_MAX_BYTES = int(os.getenv('BATCH_STORE_MAX_BYTES', 512 * 1024 * 1024))
+BATCH_ID_PATTERN = re.compile(r'^[a-f0-9]{10}$')
+
+# Metrics endpoint (disabled unless METRICS_PORT is set)
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Shared HTTP client for file downloads (created on first use)
+download_client = None
+
+# Processing slot of the running update: [processor, task, held]
+_update_slot = contextvars.ContextVar('update_slot', default=None)
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates from different users concurrently,
+    but updates from the same user strictly one after another.
+    Keeps the ConversationHandler state machine consistent.
+    
+    The per-user lock is taken before one of the max_concurrent_updates
+    slots, so updates queued behind the same user hold no slot and one
+    busy user cannot starve everybody else. Updates waiting for memory
+    budget give their slot back too, see update_slot_released().
+    """
+    
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # user_id -> [lock, number of updates using it]
+        self._user_locks = {}
+        # Updates whose turn it is, waiting for a free slot
+        self._slot_waiting = 0
+    
+    async def process_update(self, update, coroutine):
+        user = getattr(update, 'effective_user', None)
+        if user is None:
+            await self._process_in_slot(update, coroutine)
+            return
+        
+        entry = self._user_locks.get(user.id)
+        if entry is None:
+            entry = self._user_locks[user.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        
+        try:
+            async with entry[0]:
+                # Global slot is only taken once it is this update's turn
+                await self._process_in_slot(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._user_locks[user.id]
+    
+    async def _acquire_slot(self):
+        self._slot_waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._slot_waiting -= 1
+    
+    async def _process_in_slot(self, update, coroutine):
+        """BaseUpdateProcessor.process_update, counting the wait for a free slot"""
+        await self._acquire_slot()
+        slot = [self, asyncio.current_task(), True]
+        token = _update_slot.set(slot)
+        try:
+            await self.do_process_update(update, coroutine)
+        finally:
+            _update_slot.reset(token)
+            if slot[2]:
+                self._semaphore.release()
+    
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+    
+    @property
+    def waiting(self):
+        """Updates queued behind another update from the same user"""
+        return sum(count - 1 for _, count in list(self._user_locks.values()))
+    
+    @property
+    def slot_waiting(self):
+        """Updates ready to run but waiting for one of the max_concurrent_updates slots"""
+        return self._slot_waiting
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        self._user_locks.clear()
+
+@contextlib.asynccontextmanager
+async def update_slot_released():
+    """
+    Let other updates run in the current update's processing slot while it
+    waits, then queue for a slot again. The user lock stays held, so that
+    user's later updates still run after this one.
+    """
+    slot = _update_slot.get()
+    if slot is None or slot[1] is not asyncio.current_task() or not slot[2]:
+        yield
+        return
+    
+    processor = slot[0]
+    slot[2] = False
+    processor._semaphore.release()
+    try:
+        yield
+    finally:
+        await processor._acquire_slot()
+        slot[2] = True
+
+class ServerBusy(Exception):
+    """Job waited too long for memory budget"""
+
+class MemoryBudget:
+    """
+    Admission control - keeps estimated bytes of in-flight work under a global budget
+    
+    Jobs reserve their estimate and wait in FIFO order until it fits next to
+    running jobs and `held()` (parsed sessions). A job bigger than the whole
+    budget runs once nothing else is reserved.
+    """
+    
+    # Parsed sessions shrink without a release, so waiters also re-check this often
+    POLL_INTERVAL = 1.0
+    
+    def __init__(self, budget, held=lambda: 0):
+        self.budget = budget
+        self.held = held
+        self.reserved = 0
+        # [nbytes] per waiting job, in arrival order
+        self._queue = deque()
+        self._changed = asyncio.Event()
+        # Moving average of how long a reservation is held
+        self._avg_duration = None
+    
+    def _fits(self, nbytes):
+        return self.reserved == 0 or self.reserved + self.held() + nbytes <= self.budget
+    
+    @property
+    def queued(self):
+        return len(self._queue)
+    
+    def estimate_wait(self, position):
+        """Seconds until the job at `position` in the queue is likely admitted"""
+        average = self._avg_duration or 10.0
+        needed = sum(entry[0] for entry in list(self._queue)[:position + 1])
+        excess = self.reserved + self.held() + needed - self.budget
+        if self.reserved == 0 or excess <= 0:
+            return average
+        # Running jobs release `reserved` bytes about every `average` seconds
+        return max(1.0, average * excess / self.reserved)
+    
+    async def acquire(self, nbytes, on_wait=None, timeout=ADMISSION_TIMEOUT):
+        """
+        Wait until `nbytes` fit, then reserve them
+        on_wait(position, seconds) is awaited once if the job has to queue
+        Raises ServerBusy after `timeout` seconds in the queue
+        """
+        nbytes = min(nbytes, self.budget)
+        if not self._queue and self._fits(nbytes):
+            self.reserved += nbytes
+            return nbytes
+        
+        entry = [nbytes]
+        self._queue.append(entry)
+        admitted = False
+        try:
+            # Queued jobs must not hold update slots, /start and /cancel of other users keep working
+            async with update_slot_released():
+                try:
+                    if on_wait:
+                        position = len(self._queue) - 1
+                        await on_wait(position, self.estimate_wait(position))
+                    
+                    deadline = time.monotonic() + timeout
+                    while not (self._queue[0] is entry and self._fits(nbytes)):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise ServerBusy("Server is busy right now, please try again in a few minutes!")
+                        self._changed.clear()
+                        try:
+                            await asyncio.wait_for(self._changed.wait(), min(remaining, self.POLL_INTERVAL))
+                        except asyncio.TimeoutError:
+                            pass
+                finally:
+                    self._queue.remove(entry)
+                    # Next in line may fit now
+                    self._changed.set()
+                
+                # Reserved before queueing for a slot again, so the next job is not held up
+                self.reserved += nbytes
+                admitted = True
+        except BaseException:
+            if admitted:
+                self.release(nbytes)
+            raise
+        
+        return nbytes
+    
+    def release(self, nbytes, duration=None):
+        self.reserved -= nbytes
+        if duration is not None:
+            self._avg_duration = duration if self._avg_duration is None else 0.8 * self._avg_duration + 0.2 * duration
+        self._changed.set()
+    
+    def reserve(self, nbytes, on_wait=None):
+        """async with memory_budget.reserve(nbytes): ..."""
+        return _Reservation(self, nbytes, on_wait)
+
+class _Reservation:
+    def __init__(self, budget, nbytes, on_wait):
+        self.budget = budget
+        self.nbytes = nbytes
+        self.on_wait = on_wait
+    
+    async def __aenter__(self):
+        # Handlers refresh their status message when the job had to queue
+        self.waited = False
+        
+        async def on_wait(position, seconds):
+            self.waited = True
+            if self.on_wait:
+                await self.on_wait(position, seconds)
+        
+        self.nbytes = await self.budget.acquire(self.nbytes, on_wait)
+        self.started = time.monotonic()
+        return self
+    
+    async def __aexit__(self, *exc):
+        self.budget.release(self.nbytes, time.monotonic() - self.started)
+
+def estimate_session_bytes(user_data):
+    """Rough size of one user's session data in memory"""
+    total = sys.getsizeof(user_data)
+    for file in user_data.get('files', []):
+        for category, items in file['categories'].items():
+            total += sys.getsizeof(category) + sys.getsizeof(items)
+            for item in items:
+                total += sys.getsizeof(item) + sum(sys.getsizeof(value) for value in item.values())
+    return total
+
+def total_session_bytes():
+    """Bytes held in user_data_store across all conversations"""
+    # Read from the metrics thread, so work on a snapshot
+    return sum(estimate_session_bytes(user_data) for user_data in list(user_data_store.values()))
+
+def session_held_bytes():
+    """Estimated bytes of parsed files waiting in user_data_store"""
+    return SESSION_BYTES_PER_ITEM * sum(
+        len(items)
+        for user_data in list(user_data_store.values())
+        for file in user_data.get('files', ())
+        for items in file['categories'].values()
+    )
+
+memory_budget = MemoryBudget(MEMORY_BUDGET, held=session_held_bytes)
+
+# Metrics
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 * 1024, 5 * 1024 * 1024, 20 * 1024 * 1024, 50 * 1024 * 1024)
+HANDLER_LATENCY = metrics.Histogram('bot_handler_duration_seconds', 'Handler latency', labels=('handler',))
+UPLOAD_BYTES = metrics.Histogram('bot_upload_bytes', 'Size of downloaded uploads', buckets=SIZE_BUCKETS)
+OUTPUT_BYTES = metrics.Histogram('bot_output_bytes', 'Size of sent HTML/ZIP files', buckets=SIZE_BUCKETS)
+CONVERSIONS_IN_PROGRESS = metrics.Gauge('bot_conversions_in_progress', 'Conversions being rendered or sent')
+RESULT_CACHE_LOOKUPS = metrics.Counter('bot_result_cache_lookups_total', 'Result cache lookups', labels=('result',))
+API_ERRORS = metrics.Counter('bot_telegram_api_errors_total', 'Failed Bot API requests', labels=('endpoint', 'error'))
+HANDLER_ERRORS = metrics.Counter('bot_handler_errors_total', 'Errors reaching the error handler', labels=('error',))
+metrics.Gauge('bot_active_conversations', 'Users with data in session storage', func=lambda: len(user_data_store))
+metrics.Gauge('bot_session_storage_bytes', 'Estimated bytes held in session storage', func=total_session_bytes)
+metrics.Gauge('bot_memory_reserved_bytes', 'Estimated bytes reserved by running downloads and renders', func=lambda: memory_budget.reserved)
+metrics.Gauge('bot_admission_queue_length', 'Jobs waiting for memory budget', func=lambda: memory_budget.queued)
+
+track_handler = metrics.timed(HANDLER_LATENCY)
+
 def encrypt_link(link, password):
     """Encrypt link using password-based key"""
     key = hashlib.sha256(password.encode()).digest()
     encrypted = base64.b64encode((link + "|" + password).encode()).decode()
     return encrypted
 
+def decrypt_link(encrypted, password):
+    """Reverse of encrypt_link, None if it does not belong to password"""
+    decoded = base64.b64decode(encrypted).decode()
+    suffix = '|' + password
+    return decoded[:-len(suffix)] if decoded.endswith(suffix) else None
+
 def detect_file_type(link):
     """
     ✅ ENHANCED: Detect file type from link
@@ -60,7 +441,520 @@ def detect_file_type(link):
     # Default to OTHER
     return 'OTHER'
 
-def parse_txt_content(content):
+# Path segments that change per link (ids, hashes, tokens)
+DYNAMIC_SEGMENT = re.compile(r'^(?=.*\d)[A-Za-z0-9_\-=.%]{8,}$|^\d+$')
+
+def link_pattern(link):
+    """
+    Host + path pattern used as probe cache key
+    Dynamic segments and the file name are replaced with *
+    e.g. https://cdn.x.com/v/8f3a9c2e11/master?sig=.. -> cdn.x.com/v/*/*
+    """
+    parts = urlsplit(link)
+    segments = [segment for segment in parts.path.split('/') if segment]
+    if segments:
+        segments[-1] = '*'
+    segments = ['*' if DYNAMIC_SEGMENT.match(segment) else segment for segment in segments]
+    return parts.netloc.lower() + '/' + '/'.join(segments)
+
+def type_from_content_type(content_type):
+    """Map Content-Type header to our file types"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    
+    if content_type.startswith('video/') or content_type in (
+        'application/vnd.apple.mpegurl', 'application/x-mpegurl', 'application/dash+xml'
+    ):
+        return 'VIDEO'
+    if content_type.startswith('image/'):
+        return 'IMAGE'
+    if content_type in (
+        'application/pdf', 'application/msword', 'application/zip',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'application/x-rar-compressed', 'application/vnd.rar'
+    ):
+        return 'PDF'
+    return 'OTHER'
+
+async def resolve_public(host, port):
+    """
+    Address to connect to for a probe, None if the host does not resolve or
+    any of its addresses is loopback, private, link-local or otherwise not public
+    """
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        return None
+    if not infos:
+        return None
+    
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        # ::ffff:127.0.0.1 is loopback too
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not (address.is_global or PROBE_ALLOW_PRIVATE):
+            return None
+    return infos[0][4][0]
+
+async def probe_request(client, method, link, headers=None):
+    """
+    Send one probe, following redirects by hand
+    Every hop is resolved and checked, then sent to that checked address
+    (Host header and TLS name stay the original host), so DNS can't swap in
+    an internal address after the check
+    Returns (status, content type), None if a hop was refused
+    """
+    url = httpx.URL(link)
+    for _ in range(PROBE_MAX_REDIRECTS + 1):
+        if url.scheme not in ('http', 'https') or not url.raw_host:
+            return None
+        host = url.raw_host.decode('ascii')
+        address = await resolve_public(host, url.port or (443 if url.scheme == 'https' else 80))
+        if address is None:
+            return None
+        
+        request = client.build_request(
+            method,
+            url.copy_with(host=address),
+            headers={**(headers or {}), 'Host': url.netloc.decode('ascii')},
+            extensions={'sni_hostname': host}
+        )
+        response = await client.send(request, stream=True, follow_redirects=False)
+        try:
+            if response.is_redirect:
+                url = url.join(response.headers['location'])
+                continue
+            return response.status_code, response.headers.get('content-type')
+        finally:
+            await response.aclose()
+    return None
+
+async def probe_link_type(client, link):
+    """
+    Detect file type from the server's Content-Type
+    HEAD first, ranged GET if HEAD is not allowed
+    Returns None if the server could not be reached, OTHER for refused targets
+    """
+    try:
+        result = await probe_request(client, 'HEAD', link)
+        if result is None:
+            return 'OTHER'
+        status, content_type = result
+        
+        if status >= 400 or not content_type:
+            result = await probe_request(client, 'GET', link, {'Range': 'bytes=0-0'})
+            if result is None or result[0] >= 400:
+                return 'OTHER'
+            content_type = result[1]
+        
+        return type_from_content_type(content_type)
+    except httpx.HTTPError:
+        return None
+
+async def probe_unclassified(categories, client=None):
+    """
+    Classify OTHER links by probing their Content-Type
+    - One probe per host/path pattern, result is cached
+    - At most PROBE_CONCURRENCY requests at once over pooled connections
+    Updates items in place, returns number of reclassified items
+    """
+    # Group unclassified items by pattern
+    pending = {}
+    for items in categories.values():
+        for item in items:
+            if item['type'] == 'OTHER':
+                pending.setdefault(link_pattern(item['link']), []).append(item)
+    
+    if not pending:
+        return 0
+    
+    unknown = [pattern for pattern in pending if pattern not in probe_cache]
+    
+    if unknown:
+        own_client = client is None
+        if own_client:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=PROBE_CONCURRENCY),
+                timeout=PROBE_TIMEOUT
+            )
+        semaphore = asyncio.Semaphore(PROBE_CONCURRENCY)
+        
+        async def probe(pattern):
+            async with semaphore:
+                return await probe_link_type(client, pending[pattern][0]['link'])
+        
+        try:
+            detected = await asyncio.gather(*(probe(pattern) for pattern in unknown))
+        finally:
+            if own_client:
+                await client.aclose()
+        
+        for pattern, file_type in zip(unknown, detected):
+            # Network errors are not cached, next upload tries again
+            if file_type is None:
+                continue
+            probe_cache[pattern] = file_type
+            while len(probe_cache) > PROBE_CACHE_SIZE:
+                probe_cache.popitem(last=False)
+    
+    reclassified = 0
+    for pattern, items in pending.items():
+        file_type = probe_cache.get(pattern, 'OTHER')
+        if file_type != 'OTHER':
+            for item in items:
+                item['type'] = file_type
+            reclassified += len(items)
+    
+    return reclassified
+
+def is_allowed_document(document):
+    """
+    Check an uploaded document before downloading it
+    Returns an error message, or None if the document is accepted
+    """
+    if document.file_size and document.file_size > MAX_FILE_SIZE:
+        return f"File too large! Max size: {MAX_FILE_SIZE // (1024 * 1024)} MB"
+    
+    mime_type = (document.mime_type or '').lower()
+    file_name = (document.file_name or '').lower()
+    
+    if mime_type in ALLOWED_MIME_TYPES or is_zip_document(document):
+        return None
+    
+    # Some clients send TXT files without a proper MIME type
+    if mime_type in ('', 'application/octet-stream') and file_name.endswith('.txt'):
+        return None
+    
+    return f"Unsupported file type: {mime_type or 'unknown'}"
+
+def is_zip_document(document):
+    """Check if uploaded document is a ZIP archive"""
+    mime_type = (document.mime_type or '').lower()
+    return mime_type in ZIP_MIME_TYPES or (document.file_name or '').lower().endswith('.zip')
+
+def open_local_file(file_path, base_file_url):
+    """
+    Open a document stored by a local Bot API server
+    A --local server answers getFile with an absolute path on its own disk and
+    does not serve that file over HTTP, so a path this process can't read is an
+    error (server in another container without the shared volume), not a download
+    """
+    # PTB prefixes paths it can't find on this machine with base_file_url
+    prefix = f"{base_file_url}/"
+    if file_path.startswith(prefix):
+        file_path = file_path[len(prefix):]
+    if not os.path.isabs(file_path) or not os.path.isfile(file_path):
+        print(f"Local Bot API file not readable: {file_path}")
+        raise ValueError("Uploaded file is not readable by the bot! Ask the admin to check the Bot API server's shared folder.")
+    size = os.path.getsize(file_path)
+    # File size reported by Telegram is not trusted blindly
+    if size > MAX_FILE_SIZE:
+        raise ValueError(f"File too large! Max size: {MAX_FILE_SIZE // (1024 * 1024)} MB")
+    UPLOAD_BYTES.observe(size)
+    return open(file_path, 'rb')
+
+async def download_document(document):
+    """
+    Stream a document into a spooled temporary file in chunks
+    Small files stay in memory, bigger ones roll over to disk
+    In local mode the file written by the Bot API server is opened directly, no copy
+    """
+    file = await document.get_file()
+    bot = document.get_bot()
+    if bot.local_mode:
+        return await asyncio.to_thread(open_local_file, file.file_path, bot.base_file_url)
+    
+    global download_client
+    if download_client is None:
+        download_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=CONNECTION_POOL_SIZE),
+            timeout=httpx.Timeout(
+                connect=CONNECT_TIMEOUT,
+                read=READ_TIMEOUT,
+                write=WRITE_TIMEOUT,
+                pool=POOL_TIMEOUT
+            )
+        )
+    
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    received = 0
+    
+    try:
+        async with download_client.stream('GET', file.file_path) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                received += len(chunk)
+                # File size reported by Telegram is not trusted blindly
+                if received > MAX_FILE_SIZE:
+                    raise ValueError(f"File too large! Max size: {MAX_FILE_SIZE // (1024 * 1024)} MB")
+                spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    
+    UPLOAD_BYTES.observe(received)
+    spool.seek(0)
+    return spool
+
+def iter_txt_lines(fileobj):
+    """Decode a binary file object line by line as UTF-8"""
+    return io.TextIOWrapper(fileobj, encoding='utf-8')
+
+def file_stem(file_name):
+    """File name without folders and extension"""
+    return os.path.splitext(os.path.basename(file_name or 'file.txt'))[0]
+
+def parse_zip_archive(fileobj):
+    """
+    Parse every TXT file inside a ZIP archive
+    Returns list of (name, categories, parse report)
+    """
+    results = []
+    
+    with zipfile.ZipFile(fileobj) as archive:
+        members = [
+            member for member in archive.infolist()
+            if not member.is_dir()
+            and member.filename.lower().endswith('.txt')
+            and not member.filename.startswith('__MACOSX/')
+        ]
+        
+        if not members:
+            raise ValueError("No TXT files found in ZIP!")
+        if len(members) > MAX_BATCH_FILES:
+            raise ValueError(f"Too many files! Max {MAX_BATCH_FILES} per batch")
+        # Protect against zip bombs before extracting anything
+        if sum(member.file_size for member in members) > MAX_ZIP_UNCOMPRESSED:
+            raise ValueError("ZIP too large when extracted!")
+        
+        for member in members:
+            report = {}
+            with archive.open(member) as raw, iter_txt_lines(raw) as lines:
+                results.append((file_stem(member.filename), parse_txt_content(lines, report), report))
+    
+    return results
+
+async def load_document(document):
+    """
+    Download and parse an uploaded TXT or ZIP document
+    Returns list of {'name', 'categories', 'report'} for files that have links
+    """
+    spool = await download_document(document)
+    
+    with spool:
+        if is_zip_document(document):
+            parsed = await asyncio.to_thread(parse_zip_archive, spool)
+        else:
+            report = {}
+            with iter_txt_lines(spool) as lines:
+                categories = await asyncio.to_thread(parse_txt_content, lines, report)
+            parsed = [(file_stem(document.file_name), categories, report)]
+    
+    files = [
+        {'name': name, 'categories': categories, 'report': report}
+        for name, categories, report in parsed
+        if categories and any(len(items) > 0 for items in categories.values())
+    ]
+    
+    if PROBE_LINKS:
+        for file in files:
+            await probe_unclassified(file['categories'])
+    
+    return files
+
+def count_items(files, file_type=None):
+    """Count items across all files, optionally only one type"""
+    return sum(
+        1
+        for file in files
+        for items in file['categories'].values()
+        for item in items
+        if file_type is None or item['type'] == file_type
+    )
+
+def upload_memory_estimate(document):
+    """Peak bytes to download and parse one upload"""
+    size = document.file_size or MAX_FILE_SIZE
+    if is_zip_document(document):
+        size = min(size * ZIP_EXPANSION_ESTIMATE, MAX_ZIP_UNCOMPRESSED)
+    return size * UPLOAD_MEMORY_FACTOR
+
+def admission_notice(position, seconds):
+    """Status text while a job waits for memory budget"""
+    wait = f"{round(seconds)}s" if seconds < 90 else f"{round(seconds / 60)} min"
+    return (
+        "⏳ Server is busy, your file is in the queue\n"
+        f"👥 Jobs ahead: {position}\n"
+        f"⌛ Estimated wait: ~{wait}"
+    )
+
+def edit_queue_status(message):
+    """on_wait callback showing the queue position in a status message"""
+    async def on_wait(position, seconds):
+        await message.edit_text(admission_notice(position, seconds))
+    return on_wait
+
+# Parser patterns - every one runs in linear time
+URL_PATTERN = re.compile(r'https?://\S+')
+# ':' + URL that ends the title of [CATEGORY] Title: URL
+TITLE_SEPARATOR_PATTERN = re.compile(r':\s*(https?://\S+)')
+WHITESPACE_PATTERN = re.compile(r'\s*')
+CATEGORY_PREFIX_PATTERN = re.compile(r'^\[([^\]]+)\]\s*(.+)')
+CATEGORY_STRIP_PATTERN = re.compile(r'^\[([^\]]+)\]\s*')
+EXPORT_HEADERS = ('CONTENT EXPORT:', 'ID:', '===')
+DEFAULT_CATEGORY = "OTHER"
+
+# Lines sampled to pick a format profile
+PROFILE_SAMPLE_LINES = 50
+PROFILE_THRESHOLD = 0.8
+
+# Title shared by every link of a multi-link line is cut to this length,
+# keeps the output linear in the line length
+MAX_SHARED_TITLE_LENGTH = 200
+# Skipped line numbers kept in a parse report
+MAX_REPORTED_LINES = 20
+
+def match_bracketed(line):
+    r"""
+    Split [CATEGORY] Title: URL without backtracking
+    Same result as the regex ^\[([^\]]+)\]\s*(.+?):\s*(https?://\S+)
+    (the lazy title made that one quadratic on long lines with many colons)
+    Returns (category, title, url) unstripped, None if line does not fit
+    """
+    if not line.startswith('['):
+        return None
+    close = line.find(']')
+    if close < 2:
+        return None
+    
+    title_start = WHITESPACE_PATTERN.match(line, close + 1).end()
+    # Title is at least one character, so the first candidate ':' comes after it
+    separator = TITLE_SEPARATOR_PATTERN.search(line, title_start + 1)
+    if separator:
+        return line[1:close], line[title_start:separator.start()], separator.group(1)
+    
+    # Title may also be the last whitespace character before ':'
+    if title_start > close + 1:
+        separator = TITLE_SEPARATOR_PATTERN.match(line, title_start)
+        if separator:
+            return line[1:close], line[title_start - 1:title_start], separator.group(1)
+    
+    return None
+
+def parse_line_generic(line):
+    """
+    Parse one line trying every method in turn
+    Returns list of (category, title, link)
+    """
+    # ✅ METHOD 1: Standard format [CATEGORY] Title: URL
+    # Pattern: [CATEGORY] anything before last http/https
+    category_match = match_bracketed(line)
+    
+    if category_match:
+        return [tuple(part.strip() for part in category_match)]
+    
+    # ✅ METHOD 2: Without category - Title: URL
+    # Just split on : and take last http
+    if ':' in line and ('http://' in line or 'https://' in line):
+        # Find ALL URLs in line (for multiple PDFs case)
+        urls = URL_PATTERN.findall(line)
+        
+        if urls:
+            # Get text before first URL as title base
+            first_url_pos = line.find(urls[0])
+            text_before_url = line[:first_url_pos].strip()
+            
+            # Remove [CATEGORY] if present
+            category = DEFAULT_CATEGORY
+            cat_match = CATEGORY_PREFIX_PATTERN.match(text_before_url)
+            if cat_match:
+                category = cat_match.group(1).strip()
+                text_before_url = cat_match.group(2).strip()
+            
+            # Remove trailing colon
+            text_before_url = text_before_url.rstrip(':').strip()
+            if len(urls) > 1:
+                text_before_url = text_before_url[:MAX_SHARED_TITLE_LENGTH]
+            
+            entries = []
+            for idx, url in enumerate(urls):
+                # For multiple URLs, add index to title
+                if len(urls) > 1:
+                    title = f"{text_before_url} - Part {idx + 1}"
+                else:
+                    title = text_before_url
+                entries.append((category, title if title else f"Item {idx + 1}", url))
+            
+            return entries
+    
+    # ✅ METHOD 3: Fallback - Just extract all URLs
+    # For lines where format is completely different
+    entries = []
+    for idx, url_match in enumerate(URL_PATTERN.finditer(line)):
+        url = url_match.group(0)
+        # Try to get text before URL as title
+        title = line[max(0, url_match.start() - MAX_SHARED_TITLE_LENGTH):url_match.start()].strip()
+        
+        # Clean title
+        title = CATEGORY_STRIP_PATTERN.sub('', title)  # Remove [CATEGORY]
+        title = title.rstrip(':').strip()
+        
+        if not title:
+            title = f"Link {idx + 1}"
+        
+        entries.append((DEFAULT_CATEGORY, title, url))
+    
+    return entries
+
+def parse_line_bracketed(line):
+    """Fast path: [CATEGORY] Title: URL, None if line does not fit"""
+    category_match = match_bracketed(line)
+    if not category_match:
+        return None
+    return [tuple(part.strip() for part in category_match)]
+
+def parse_line_plain(line):
+    """Fast path: Title: URL with a single URL, None if line does not fit"""
+    if line.startswith('['):
+        return None
+    url_match = URL_PATTERN.search(line)
+    if not url_match or URL_PATTERN.search(line, url_match.end()):
+        return None
+    title = line[:url_match.start()].strip().rstrip(':').strip()
+    return [(DEFAULT_CATEGORY, title if title else "Item 1", url_match.group(0))]
+
+# Format profile -> fast path (None = generic parsing for every line)
+FORMAT_PROFILES = {
+    'bracketed': parse_line_bracketed,
+    'plain': parse_line_plain,
+    'export': parse_line_plain,
+    'freeform': None,
+}
+
+def detect_format_profile(sample):
+    """
+    Pick a format profile from the first lines of a file
+    - export: has CONTENT EXPORT / ID headers, items are Title: URL
+    - bracketed: mostly [CATEGORY] Title: URL
+    - plain: mostly Title: URL
+    - freeform: anything else
+    """
+    lines = [line.strip() for line in sample if len(line) <= MAX_LINE_LENGTH]
+    if any(line.startswith(EXPORT_HEADERS[:2]) for line in lines):
+        return 'export'
+    
+    url_lines = [line for line in lines if 'http://' in line or 'https://' in line]
+    if not url_lines:
+        return 'freeform'
+    
+    for profile in ('bracketed', 'plain'):
+        matched = sum(1 for line in url_lines if FORMAT_PROFILES[profile](line) is not None)
+        if matched >= PROFILE_THRESHOLD * len(url_lines):
+            return profile
+    
+    return 'freeform'
+
+def parse_txt_content(content, report=None):
     """
     ✅ SUPER ROBUST PARSER - Detects ALL links
     
@@ -69,41 +963,64 @@ def parse_txt_content(content):
     2. Title: URL
     3. [CATEGORY] Title: URL (multiple PDFs on same line)
     
+    Accepts the whole text or any iterable of lines (e.g. an open file),
+    so big files are parsed incrementally.
+    
+    The first lines pick a format profile; the rest of the file goes
+    through that profile's fast path, falling back to trying every
+    method only for lines that do not fit.
+    
+    Worst case is linear in the input: link lines over MAX_LINE_LENGTH
+    are skipped and parsing stops after PARSE_TIME_BUDGET seconds.
+    Pass a dict as `report` to get 'skipped' (count), 'skipped_lines'
+    (first line numbers) and 'stopped_at' (line number or None).
+    
     Inspired by reference repository's parse logic
     """
-    lines = content.strip().split('\n')
+    lines = iter(content.strip().split('\n') if isinstance(content, str) else content)
     categories = {}
-    default_category = "OTHER"
+    
+    sample = list(itertools.islice(lines, PROFILE_SAMPLE_LINES))
+    profile = detect_format_profile(sample)
+    fast_path = FORMAT_PROFILES[profile]
     
     # Stats for debugging
     total_lines = 0
     parsed_lines = 0
+    skipped = 0
+    skipped_lines = []
+    stopped_at = None
+    deadline = time.monotonic() + PARSE_TIME_BUDGET
     
-    for line in lines:
+    for line in itertools.chain(sample, lines):
         total_lines += 1
+        # Clock is checked every few hundred lines, a line costs at most MAX_LINE_LENGTH
+        if total_lines % 256 == 0 and time.monotonic() > deadline:
+            stopped_at = total_lines
+            break
         line = line.strip()
         
         # Skip empty lines and metadata headers
-        if not line:
-            continue
-        if line.startswith('CONTENT EXPORT:') or line.startswith('ID:') or line.startswith('==='):
+        if not line or line.startswith(EXPORT_HEADERS):
             continue
         
         # ✅ CRITICAL: Check if line has URL
         if not ('http://' in line or 'https://' in line):
             continue
         
-        # ✅ METHOD 1: Standard format [CATEGORY] Title: URL
-        # Pattern: [CATEGORY] anything before last http/https
-        category_match = re.match(r'^\[([^\]]+)\]\s*(.+?):\s*(https?://\S+)', line)
+        # Pasted blobs (minified JSON etc.) are skipped, not parsed
+        if len(line) > MAX_LINE_LENGTH:
+            skipped += 1
+            if len(skipped_lines) < MAX_REPORTED_LINES:
+                skipped_lines.append(total_lines)
+            continue
+        
+        entries = fast_path(line) if fast_path else None
+        if entries is None:
+            entries = parse_line_generic(line)
         
-        if category_match:
+        for category, title, link in entries:
             parsed_lines += 1
-            category = category_match.group(1).strip()
-            title = category_match.group(2).strip()
-            link = category_match.group(3).strip()
-            
-            file_type = detect_file_type(link)
             
             if category not in categories:
                 categories[category] = []
@@ -111,109 +1028,347 @@ def parse_txt_content(content):
             categories[category].append({
                 'title': title,
                 'link': link,
-                'type': file_type
+                'type': detect_file_type(link)
             })
-            continue
-        
-        # ✅ METHOD 2: Without category - Title: URL
-        # Just split on : and take last http
-        if ':' in line and ('http://' in line or 'https://' in line):
-            # Find ALL URLs in line (for multiple PDFs case)
-            urls = re.findall(r'https?://\S+', line)
-            
-            if urls:
-                # Get text before first URL as title base
-                first_url_pos = line.find(urls[0])
-                text_before_url = line[:first_url_pos].strip()
-                
-                # Remove [CATEGORY] if present
-                category = default_category
-                cat_match = re.match(r'^\[([^\]]+)\]\s*(.+)', text_before_url)
-                if cat_match:
-                    category = cat_match.group(1).strip()
-                    text_before_url = cat_match.group(2).strip()
-                
-                # Remove trailing colon
-                text_before_url = text_before_url.rstrip(':').strip()
-                
-                # Process each URL
-                for idx, url in enumerate(urls):
-                    parsed_lines += 1
-                    
-                    # For multiple URLs, add index to title
-                    if len(urls) > 1:
-                        title = f"{text_before_url} - Part {idx + 1}"
-                    else:
-                        title = text_before_url
-                    
-                    file_type = detect_file_type(url)
-                    
-                    if category not in categories:
-                        categories[category] = []
-                    
-                    categories[category].append({
-                        'title': title if title else f"Item {idx + 1}",
-                        'link': url,
-                        'type': file_type
-                    })
-                
-                continue
-        
-        # ✅ METHOD 3: Fallback - Just extract all URLs
-        # For lines where format is completely different
-        urls = re.findall(r'https?://\S+', line)
-        if urls:
-            for idx, url in enumerate(urls):
-                parsed_lines += 1
-                
-                # Try to get text before URL as title
-                url_pos = line.find(url)
-                title = line[:url_pos].strip()
-                
-                # Clean title
-                title = re.sub(r'^\[([^\]]+)\]\s*', '', title)  # Remove [CATEGORY]
-                title = title.rstrip(':').strip()
-                
-                if not title:
-                    title = f"Link {idx + 1}"
-                
-                file_type = detect_file_type(url)
-                
-                if default_category not in categories:
-                    categories[default_category] = []
-                
-                categories[default_category].append({
-                    'title': title,
-                    'link': url,
-                    'type': file_type
-                })
     
-    print(f"📊 Parser Stats: {parsed_lines}/{total_lines} lines parsed")
+    print(
+        f"📊 Parser Stats: {parsed_lines}/{total_lines} lines parsed (profile: {profile})"
+        + (f", {skipped} long lines skipped" if skipped else "")
+        + (f", stopped at line {stopped_at} (time budget)" if stopped_at else "")
+    )
+    if report is not None:
+        report.update(skipped=skipped, skipped_lines=skipped_lines, stopped_at=stopped_at)
     return categories
 
+def parse_warnings(report):
+    """User-facing lines describing what the parser skipped"""
+    warnings = []
+    if report.get('skipped'):
+        lines = ', '.join(str(number) for number in report['skipped_lines'])
+        more = f" +{report['skipped'] - len(report['skipped_lines'])} more" if report['skipped'] > len(report['skipped_lines']) else ""
+        warnings.append(f"⚠️ Skipped {report['skipped']} line(s) longer than {MAX_LINE_LENGTH} chars: {lines}{more}")
+    if report.get('stopped_at'):
+        warnings.append(f"⚠️ File took too long, stopped at line {report['stopped_at']}")
+    return warnings
+
+def encode_item(item, password):
+    """Encrypted form of one parsed item, as embedded in the HTML"""
+    return {
+        'title': item['title'],
+        'link': encrypt_link(item['link'], password),
+        'type': item['type']
+    }
+
+def encode_categories(categories, password):
+    """Encrypt all links of parsed categories"""
+    return {
+        category: [encode_item(item, password) for item in items]
+        for category, items in categories.items()
+    }
+
+def merge_categories(encrypted_data, categories, password):
+    """
+    Merge newly parsed categories into already encrypted ones
+    Only new links are encrypted, links already in the batch are skipped
+    Returns (added, duplicates)
+    """
+    known_links = {item['link'] for items in encrypted_data.values() for item in items}
+    added = duplicates = 0
+    
+    for category, items in categories.items():
+        for item in items:
+            encoded = encode_item(item, password)
+            if encoded['link'] in known_links:
+                duplicates += 1
+                continue
+            known_links.add(encoded['link'])
+            encrypted_data.setdefault(category, []).append(encoded)
+            added += 1
+    
+    return added, duplicates
+
+def batch_path(batch_id):
+    """Path of a stored batch, None for invalid ids"""
+    if not BATCH_ID_PATTERN.match(batch_id or ''):
+        return None
+    return os.path.join(BATCH_STORE_DIR, f"{batch_id}.json")
+
+def batch_expired(mtime, now=None):
+    """Check if a batch last saved at `mtime` is past BATCH_TTL_DAYS"""
+    return (now or time.time()) - mtime > BATCH_TTL_DAYS * 86400
+
+def load_batch(batch_id):
+    """Load stored batch model, None if missing or expired"""
+    path = batch_path(batch_id)
+    if not path or not os.path.exists(path):
+        return None
+    if batch_expired(os.path.getmtime(path)):
+        remove_batch_file(path)
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_batch(batch_id, batch):
+    """
+    Store batch model atomically, then prune the store
+    Files hold the password and decodable links, so only the bot user may read them
+    """
+    os.makedirs(BATCH_STORE_DIR, exist_ok=True)
+    path = batch_path(batch_id)
+    tmp_path = f"{path}.tmp"
+    with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as f:
+        json.dump(batch, f)
+    os.replace(tmp_path, path)
+    prune_batch_store()
+
+def prune_batch_store():
+    """
+    Delete expired batches and leftover temp files, then the least recently
+    updated batches until the store fits BATCH_STORE_MAX_BYTES
+    Returns number of files deleted
+    """
+    now = time.time()
+    batches = []
+    deleted = 0
+    with os.scandir(BATCH_STORE_DIR) as entries:
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith('.tmp'):
+                # Temp file of a write that died half way
+                if now - stat.st_mtime > 3600:
+                    deleted += remove_batch_file(entry.path)
+            elif entry.name.endswith('.json'):
+                if batch_expired(stat.st_mtime, now):
+                    deleted += remove_batch_file(entry.path)
+                else:
+                    batches.append((stat.st_mtime, stat.st_size, entry.path))
+    
+    total = sum(size for _, size, _ in batches)
+    for _, size, path in sorted(batches):
+        if total <= BATCH_STORE_MAX_BYTES:
+            break
+        deleted += remove_batch_file(path)
+        total -= size
+    return deleted
+
+def remove_batch_file(path):
+    """Delete one store file, 1 if it was removed (another worker may be first)"""
+    try:
+        os.remove(path)
+        return 1
+    except FileNotFoundError:
+        return 0
+
 def generate_html(categories, password, batch_name, credit_name):
     """Generate password-protected HTML"""
+    return render_html(encode_categories(categories, password), password, batch_name, credit_name)
+
+# Word separators for the search index (also used as a JS RegExp in the HTML)
+SEARCH_SPLIT = re.compile(r"[\s\-_.,:;|/\\()\[\]{}\"'!?#&+*]+")
+
+def search_tokens(text):
+    """Lowercase words of a title or category name"""
+    return {token for token in SEARCH_SPLIT.split(text.lower()) if token}
+
+def build_search_index(encrypted_data):
+    """
+    Inverted index embedded in the HTML for instant search
+    - 't': [title word, item ids] (items numbered in page order)
+    - 'c': [category word, category ids]
+    Pairs are sorted by word, the viewer binary-searches them for query
+    words as prefixes
+    """
+    title_index = {}
+    category_index = {}
+    item_id = 0
+    
+    for category_id, (category, items) in enumerate(encrypted_data.items()):
+        for token in sorted(search_tokens(category)):
+            category_index.setdefault(token, []).append(category_id)
+        for item in items:
+            for token in sorted(search_tokens(item['title'])):
+                title_index.setdefault(token, []).append(item_id)
+            item_id += 1
+    
+    return {'t': js_sorted_pairs(title_index), 'c': js_sorted_pairs(category_index)}
+
+def js_sorted_pairs(index):
+    """
+    [[key, value], ...] sorted the way JavaScript compares strings (UTF-16 code units),
+    a JS object would move integer-like keys such as '2024' to the front
+    """
+    return [[key, index[key]] for key in sorted(index, key=lambda key: key.encode('utf-16-be'))]
+
+def build_resource_hints(encrypted_data, password):
+    """
+    <link> preconnect/dns-prefetch hints for the most common video hosts
+    Cuts time-to-first-frame when Play is pressed
+    
+    <video> plays direct links without CORS, hls.js fetches .m3u8 segments
+    with CORS - these are separate connections, so each host is preconnected
+    in the mode its links are played in
+    """
+    host_counts = {}
+    # origin -> {False: direct links, True: .m3u8 links}
+    host_modes = {}
+    has_hls = False
+    
+    for items in encrypted_data.values():
+        for item in items:
+            if item['type'] != 'VIDEO':
+                continue
+            link = decrypt_link(item['link'], password) or ''
+            is_hls = '.m3u8' in link.lower()
+            parts = urlsplit(link)
+            if parts.scheme in ('http', 'https') and parts.netloc:
+                origin = f"{parts.scheme}://{parts.netloc}"
+                host_counts[origin] = host_counts.get(origin, 0) + 1
+                host_modes.setdefault(origin, set()).add(is_hls)
+            has_hls = has_hls or is_hls
+    
+    top_hosts = sorted(host_counts, key=host_counts.get, reverse=True)[:PRECONNECT_HOSTS]
+    hints = []
+    for origin in top_hosts:
+        for is_hls in sorted(host_modes[origin]):
+            crossorigin = ' crossorigin' if is_hls else ''
+            hints.append(f'<link rel="preconnect" href="{html.escape(origin)}"{crossorigin}>')
+        hints.append(f'<link rel="dns-prefetch" href="{html.escape(origin)}">')
+    
+    # Player module itself is only fetched on first HLS playback, resolve its host early
+    if has_hls:
+        hls_parts = urlsplit(HLS_JS_URL)
+        hints.append(f'<link rel="dns-prefetch" href="{html.escape(f"{hls_parts.scheme}://{hls_parts.netloc}")}">')
+    
+    return '\n    '.join(hints)
+
+class HtmlSink:
+    """Password-protected HTML page - encrypts items as they come, renders at the end"""
+    extension = 'html'
+    label = 'HTML'
+    
+    def __init__(self, password, batch_name, credit_name):
+        self.password = password
+        self.batch_name = batch_name
+        self.credit_name = credit_name
+        self.encrypted_data = {}
+    
+    def add(self, category, item):
+        self.encrypted_data.setdefault(category, []).append(encode_item(item, self.password))
+    
+    def render(self):
+        return render_html(self.encrypted_data, self.password, self.batch_name, self.credit_name)
+
+class ManifestSink:
+    """Compact JSON manifest of the batch (plain links)"""
+    extension = 'json'
+    label = 'JSON'
+    
+    def __init__(self, password, batch_name, credit_name):
+        self.manifest = {'batch': batch_name, 'credit': credit_name, 'total': 0, 'types': {}, 'categories': {}}
+    
+    def add(self, category, item):
+        self.manifest['total'] += 1
+        self.manifest['types'][item['type']] = self.manifest['types'].get(item['type'], 0) + 1
+        self.manifest['categories'].setdefault(category, []).append(
+            {'title': item['title'], 'url': item['link'], 'type': item['type']}
+        )
+    
+    def render(self):
+        manifest = dict(self.manifest)
+        manifest['categories'] = [
+            {'name': category, 'items': items}
+            for category, items in self.manifest['categories'].items()
+        ]
+        return json.dumps(manifest, ensure_ascii=False, separators=(',', ':'))
+
+class PlaylistSink:
+    """Extended M3U playlist of VIDEO items (plain links), None without videos"""
+    extension = 'm3u'
+    label = 'M3U'
+    
+    def __init__(self, password, batch_name, credit_name):
+        self.lines = ['#EXTM3U', f"#PLAYLIST:{batch_name}"]
+    
+    def add(self, category, item):
+        if item['type'] != 'VIDEO':
+            return
+        group = category.replace('"', "'")
+        self.lines.append(f'#EXTINF:-1 group-title="{group}",{item["title"]}')
+        self.lines.append(item['link'])
     
-    # Encrypt all links
-    encrypted_data = {}
+    def render(self):
+        if len(self.lines) == 2:
+            return None
+        return '\n'.join(self.lines) + '\n'
+
+# Output format -> sink, in delivery order
+OUTPUT_SINKS = {
+    'html': HtmlSink,
+    'json': ManifestSink,
+    'm3u': PlaylistSink,
+}
+
+def convert_file(categories, password, batch_name, credit_name, formats=('html',)):
+    """
+    Export one file in every selected format with a single pass over the items
+    Returns (encrypted data, {format: content}), encrypted data is None without html
+    and formats with nothing to export (m3u without videos) are left out
+    """
+    sinks = [sink(password, batch_name, credit_name) for fmt, sink in OUTPUT_SINKS.items() if fmt in formats]
     for category, items in categories.items():
-        encrypted_data[category] = []
         for item in items:
-            encrypted_data[category].append({
-                'title': item['title'],
-                'link': encrypt_link(item['link'], password),
-                'type': item['type']
-            })
+            for sink in sinks:
+                sink.add(category, item)
     
-    # Convert to JSON safely
-    encrypted_json = json.dumps(encrypted_data)
+    outputs = {sink.extension: sink.render() for sink in sinks}
+    encrypted_data = next((sink.encrypted_data for sink in sinks if isinstance(sink, HtmlSink)), None)
+    return encrypted_data, {fmt: content for fmt, content in outputs.items() if content is not None}
+
+# Items encoded per json.dumps call when the payload is streamed
+PAYLOAD_SLICE_ITEMS = 200
+
+def iter_payload_json(encrypted_data):
+    """
+    JSON of {'data': [[category, items], ...], 'search': ...} one category at a time
+    Categories are a list, not an object, so the page keeps their order whatever
+    their names (JS objects put integer-like keys first)
+    Same text as one compact json.dumps, produced a slice of items at a time
+    """
+    def dumps(value):
+        return json.dumps(value, separators=(',', ':'))
     
-    html = f'''<!DOCTYPE html>
+    yield '{"data":['
+    for index, (category, items) in enumerate(encrypted_data.items()):
+        yield f"{',' if index else ''}[{dumps(category)},["
+        for start in range(0, len(items), PAYLOAD_SLICE_ITEMS):
+            # Slice of the items array without its brackets
+            yield (',' if start else '') + dumps(items[start:start + PAYLOAD_SLICE_ITEMS])[1:-1]
+        yield ']]'
+    yield '],"search":' + dumps(build_search_index(encrypted_data)) + '}'
+
+def render_html(encrypted_data, password, batch_name, credit_name):
+    """Render HTML from already encrypted categories"""
+    return ''.join(iter_html(encrypted_data, password, batch_name, credit_name))
+
+def iter_html(encrypted_data, password, batch_name, credit_name, chunk_size=HTML_CHUNK_SIZE):
+    """
+    Render HTML piece by piece, pieces are roughly chunk_size characters
+    Lets the HTTP server stream a page while the rest is still being encoded
+    """
+    search_split_json = json.dumps(SEARCH_SPLIT.pattern)
+    resource_hints = build_resource_hints(encrypted_data, password)
+    hls_js_url = json.dumps(HLS_JS_URL)
+    
+    yield f'''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>{batch_name}</title>
+    {resource_hints}
     <style>
         * {{
             margin: 0;
@@ -492,6 +1647,26 @@ def generate_html(categories, password, batch_name, credit_name):
             letter-spacing: 1px;
         }}
 
+        .search-box {{
+            margin-bottom: 25px;
+        }}
+
+        .search-box input {{
+            width: 100%;
+            padding: 16px 20px;
+            border: 2px solid var(--border);
+            border-radius: 14px;
+            background: var(--bg-card);
+            color: var(--text-primary);
+            font-size: 16px;
+            transition: all 0.3s;
+        }}
+
+        .search-box input:focus {{
+            outline: none;
+            border-color: var(--accent);
+        }}
+
         .category {{
             background: var(--bg-card);
             padding: 25px;
@@ -724,6 +1899,9 @@ def generate_html(categories, password, batch_name, credit_name):
         </div>
 
         <div class="stats" id="stats"></div>
+        <div class="search-box">
+            <input type="search" id="searchInput" placeholder="🔍 Search lectures, PDFs, categories..." oninput="searchItems(this.value)">
+        </div>
         <div id="categories"></div>
     </div>
 
@@ -745,16 +1923,43 @@ def generate_html(categories, password, batch_name, credit_name):
         </div>
     </div>
 
+    <script type="application/json" id="payload">'''
+    
+    # Data and search index are embedded as JSON text, parsed only on a viewer cache miss.
+    # Hashed while streaming, the viewer caches the parsed payload under this hash.
+    hasher = hashlib.sha256()
+    pending = []
+    pending_size = 0
+    for piece in iter_payload_json(encrypted_data):
+        hasher.update(piece.encode('utf-8'))
+        # "</" inside a title must not close the script tag
+        pending.append(piece.replace('</', '<\\/'))
+        pending_size += len(piece)
+        if pending_size >= chunk_size:
+            yield ''.join(pending)
+            pending = []
+            pending_size = 0
+    if pending:
+        yield ''.join(pending)
+    payload_hash = hasher.hexdigest()[:16]
+    
+    yield f'''</script>
     <script>
         const PASSWORD = "{password}";
-        const encryptedData = {encrypted_json};
+        const CONTENT_HASH = "{payload_hash}";
+        const SEARCH_SPLIT = new RegExp({search_split_json});
 
-        function checkPassword() {{
+        // Filled by loadContent, same order as search index ids
+        const itemElements = [];
+        const categoryElements = [];
+        let searchIndex = null;
+
+        async function checkPassword() {{
             const input = document.getElementById('passwordInput').value;
             if (input === PASSWORD) {{
                 document.getElementById('passwordScreen').style.display = 'none';
                 document.getElementById('mainContent').style.display = 'block';
-                loadContent();
+                loadContent(await loadModel());
             }} else {{
                 alert('❌ Wrong Password!');
                 document.getElementById('passwordInput').value = '';
@@ -772,25 +1977,91 @@ def generate_html(categories, password, batch_name, credit_name):
             return null;
         }}
 
-        function loadContent() {{
-            let totalVideos = 0;
-            let totalPDFs = 0;
-            let totalImages = 0;
-            let totalOther = 0;
-            let totalItems = 0;
+        // Decoded payload is cached in IndexedDB by content hash, so reopening skips
+        // parsing and counting. Only read or written after unlock, and links stay
+        // encrypted in the cache just like in this file.
+        const VIEWER_DB = 'txt2html-viewer-v1';
+        const VIEWER_CACHE_ENTRIES = {VIEWER_CACHE_ENTRIES};
+
+        function requestResult(request) {{
+            return new Promise((resolve, reject) => {{
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            }});
+        }}
 
-            const categoriesDiv = document.getElementById('categories');
-            
-            for (const [category, items] of Object.entries(encryptedData)) {{
-                totalItems += items.length;
+        function openViewerDb() {{
+            const request = indexedDB.open(VIEWER_DB, 1);
+            request.onupgradeneeded = () => {{
+                request.result.createObjectStore('models', {{ keyPath: 'hash' }}).createIndex('savedAt', 'savedAt');
+            }};
+            // Some browsers never answer for file:// pages, don't hold the unlock up
+            const timeout = new Promise((_, reject) => setTimeout(() => reject(new Error('timeout')), 1000));
+            return Promise.race([requestResult(request), timeout]);
+        }}
+
+        function buildModel() {{
+            const payload = JSON.parse(document.getElementById('payload').textContent);
+            const stats = {{ items: 0, videos: 0, pdfs: 0, images: 0 }};
+            for (const [, items] of payload.data) {{
+                stats.items += items.length;
                 items.forEach(item => {{
-                    if (item.type === 'VIDEO') totalVideos++;
-                    else if (item.type === 'PDF') totalPDFs++;
-                    else if (item.type === 'IMAGE') totalImages++;
-                    else totalOther++;
+                    if (item.type === 'VIDEO') stats.videos++;
+                    else if (item.type === 'PDF') stats.pdfs++;
+                    else if (item.type === 'IMAGE') stats.images++;
                 }});
+            }}
+            return {{
+                hash: CONTENT_HASH,
+                savedAt: Date.now(),
+                categories: payload.data,
+                stats: stats,
+                search: payload.search
+            }};
+        }}
+
+        function saveModel(db, model) {{
+            const store = db.transaction('models', 'readwrite').objectStore('models');
+            store.put(model);
+            // Keep only the newest entries
+            const byAge = store.index('savedAt');
+            requestResult(byAge.count()).then(count => {{
+                let excess = count - VIEWER_CACHE_ENTRIES;
+                if (excess <= 0) return;
+                byAge.openCursor().onsuccess = event => {{
+                    const cursor = event.target.result;
+                    if (cursor && excess-- > 0) {{
+                        cursor.delete();
+                        cursor.continue();
+                    }}
+                }};
+            }});
+        }}
+
+        async function loadModel() {{
+            let db = null;
+            try {{
+                db = await openViewerDb();
+                const cached = await requestResult(db.transaction('models').objectStore('models').get(CONTENT_HASH));
+                if (cached) return cached;
+            }} catch(e) {{}}
 
+            const model = buildModel();
+            if (db) {{
+                try {{
+                    saveModel(db, model);
+                }} catch(e) {{}}
+            }}
+            return model;
+        }}
+
+        function loadContent(model) {{
+            const categoriesDiv = document.getElementById('categories');
+            searchIndex = model.search;
+            
+            for (const [category, items] of model.categories) {{
                 const categoryDiv = document.createElement('div');
+                const categoryStart = itemElements.length;
                 categoryDiv.className = 'category';
                 categoryDiv.innerHTML = `<div class="category-header">${{category}}</div>`;
 
@@ -820,31 +2091,119 @@ def generate_html(categories, password, batch_name, credit_name):
                         </button>
                     `;
                     categoryDiv.appendChild(itemDiv);
+                    itemElements.push(itemDiv);
                 }});
 
                 categoriesDiv.appendChild(categoryDiv);
+                categoryElements.push({{ el: categoryDiv, start: categoryStart, end: itemElements.length }});
             }}
 
             document.getElementById('stats').innerHTML = `
                 <div class="stat-card">
-                    <div class="stat-number">${{totalItems}}</div>
+                    <div class="stat-number">${{model.stats.items}}</div>
                     <div class="stat-label">All Items</div>
                 </div>
                 <div class="stat-card">
-                    <div class="stat-number">${{totalVideos}}</div>
+                    <div class="stat-number">${{model.stats.videos}}</div>
                     <div class="stat-label">Videos</div>
                 </div>
                 <div class="stat-card">
-                    <div class="stat-number">${{totalPDFs}}</div>
+                    <div class="stat-number">${{model.stats.pdfs}}</div>
                     <div class="stat-label">PDFs</div>
                 </div>
                 <div class="stat-card">
-                    <div class="stat-number">${{totalImages}}</div>
+                    <div class="stat-number">${{model.stats.images}}</div>
                     <div class="stat-label">Images</div>
                 </div>
             `;
         }}
 
+        // [key, ids] pairs are sorted by key: first key >= prefix by binary search,
+        // then the ids of every key starting with it
+        function prefixMatches(pairs, prefix) {{
+            let lo = 0, hi = pairs.length;
+            while (lo < hi) {{
+                const mid = (lo + hi) >> 1;
+                if (pairs[mid][0] < prefix) lo = mid + 1;
+                else hi = mid;
+            }}
+            const matches = [];
+            while (lo < pairs.length && pairs[lo][0].startsWith(prefix)) matches.push(pairs[lo++][1]);
+            return matches;
+        }}
+
+        function searchItems(query) {{
+            const tokens = query.toLowerCase().split(SEARCH_SPLIT).filter(Boolean);
+            let visible = null;
+
+            if (tokens.length && searchIndex) {{
+                // Every query word must match a title word or category word
+                for (const token of tokens) {{
+                    const ids = new Set();
+                    prefixMatches(searchIndex.t, token).forEach(itemIds => itemIds.forEach(id => ids.add(id)));
+                    prefixMatches(searchIndex.c, token).forEach(categoryIds => categoryIds.forEach(categoryId => {{
+                        const category = categoryElements[categoryId];
+                        for (let id = category.start; id < category.end; id++) ids.add(id);
+                    }}));
+                    visible = visible === null ? ids : new Set([...visible].filter(id => ids.has(id)));
+                }}
+            }}
+
+            itemElements.forEach((el, id) => {{
+                el.style.display = !visible || visible.has(id) ? '' : 'none';
+            }});
+            categoryElements.forEach(category => {{
+                let shown = !visible;
+                for (let id = category.start; id < category.end && !shown; id++) shown = visible.has(id);
+                category.el.style.display = shown ? '' : 'none';
+            }});
+        }}
+
+        // HLS player module, loaded once on first .m3u8 playback
+        const HLS_JS_URL = {hls_js_url};
+        let hlsLoader = null;
+        let hlsPlayer = null;
+        let playbackId = 0;
+
+        function loadHls() {{
+            if (!hlsLoader) {{
+                hlsLoader = new Promise((resolve, reject) => {{
+                    const script = document.createElement('script');
+                    script.src = HLS_JS_URL;
+                    script.onload = () => resolve(window.Hls);
+                    script.onerror = () => {{
+                        hlsLoader = null;
+                        reject(new Error('HLS player failed to load'));
+                    }};
+                    document.head.appendChild(script);
+                }});
+            }}
+            return hlsLoader;
+        }}
+
+        function playVideo(link) {{
+            const player = document.getElementById('videoPlayer');
+            const currentPlayback = ++playbackId;
+
+            // Safari plays HLS natively, other browsers need the module
+            if (link.toLowerCase().includes('.m3u8') && !player.canPlayType('application/vnd.apple.mpegurl')) {{
+                loadHls().then(Hls => {{
+                    if (currentPlayback !== playbackId) return;
+                    if (!Hls || !Hls.isSupported()) {{
+                        player.src = link;
+                        return;
+                    }}
+                    hlsPlayer = new Hls();
+                    hlsPlayer.loadSource(link);
+                    hlsPlayer.attachMedia(player);
+                }}).catch(() => {{
+                    if (currentPlayback === playbackId) player.src = link;
+                }});
+            }} else {{
+                player.src = link;
+            }}
+        }}
+
         function openLink(encrypted, title, type) {{
             const link = decryptLink(encrypted);
             if (!link) {{
@@ -854,7 +2213,7 @@ def generate_html(categories, password, batch_name, credit_name):
 
             if (type === 'VIDEO') {{
                 document.getElementById('videoTitle').textContent = title;
-                document.getElementById('videoPlayer').src = link;
+                playVideo(link);
                 document.getElementById('videoModal').style.display = 'block';
             }} else {{
                 window.open(link, '_blank');
@@ -862,6 +2221,11 @@ def generate_html(categories, password, batch_name, credit_name):
         }}
 
         function closeVideo() {{
+            playbackId++;
+            if (hlsPlayer) {{
+                hlsPlayer.destroy();
+                hlsPlayer = null;
+            }}
             document.getElementById('videoModal').style.display = 'none';
             document.getElementById('videoPlayer').pause();
             document.getElementById('videoPlayer').src = '';
@@ -888,9 +2252,8 @@ def generate_html(categories, password, batch_name, credit_name):
     </script>
 </body>
 </html>'''
-    
-    return html
 
+@track_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command handler"""
     keyboard = [[InlineKeyboardButton("📝 Create HTML", callback_data='create')]]
@@ -915,6 +2278,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=reply_markup
     )
 
+@track_handler
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle button callbacks"""
     query = update.callback_query
@@ -927,6 +2291,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "• [CATEGORY] Title: link\n"
             "• Title: link\n"
             "• Any format with URLs\n\n"
+            "📦 Many files? Send several TXT files or one ZIP!\n"
             "✅ 800+ links? No problem!"
         )
         await query.message.reply_text(msg)
@@ -934,23 +2299,64 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif query.data == 'convert':
         return await process_conversion(query, context)
 
+def build_preview(files):
+    """Build parse summary shown after upload"""
+    if len(files) == 1:
+        categories = files[0]['categories']
+        preview_text = "✅ File parsed successfully!\n\n📊 Detection:\n"
+        preview_text += f"📦 Categories: {len(categories)}\n"
+    else:
+        preview_text = f"✅ {len(files)} files parsed successfully!\n\n📊 Detection:\n"
+        preview_text += f"📁 Files: {len(files)}\n"
+    
+    preview_text += f"📊 Total Items: {count_items(files)}\n"
+    preview_text += f"🎬 Videos: {count_items(files, 'VIDEO')}\n"
+    preview_text += f"📄 PDFs: {count_items(files, 'PDF')}\n\n"
+    
+    # Show first 3 categories (or files for bulk uploads)
+    if len(files) == 1:
+        entries = [(cat, len(items)) for cat, items in files[0]['categories'].items()]
+    else:
+        entries = [(file['name'], count_items([file])) for file in files]
+    
+    for idx, (name, total) in enumerate(entries[:3]):
+        preview_text += f"\n{idx+1}. {name}: {total} items"
+    
+    if len(entries) > 3:
+        preview_text += f"\n...and {len(entries) - 3} more"
+    
+    # Lines the parser had to skip
+    for file in files:
+        for warning in parse_warnings(file.get('report', {})):
+            preview_text += f"\n\n{warning}" if len(files) == 1 else f"\n\n{file['name']}: {warning}"
+    
+    return preview_text
+
+@track_handler
 async def receive_txt_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Receive TXT file"""
+    """Receive TXT file or ZIP archive"""
     user_id = update.effective_user.id
     
-    await update.message.reply_text("⏳ Reading file with SUPER PARSER...")
+    document = update.message.document
+    
+    # Check size and type before downloading anything
+    error = is_allowed_document(document)
+    if error:
+        await update.message.reply_text(f"❌ {error}\n\nकृपया valid TXT file भेजें!")
+        return TXT_FILE
+    
+    # One status message, edited as we go
+    status = await update.message.reply_text("⏳ Reading file with SUPER PARSER...")
     
     try:
-        # Download and read file
-        file = await update.message.document.get_file()
-        content = await file.download_as_bytearray()
-        txt_content = content.decode('utf-8')
+        # Wait for memory budget, then download in chunks and parse line by line
+        async with memory_budget.reserve(upload_memory_estimate(document), edit_queue_status(status)) as reservation:
+            if reservation.waited:
+                await status.edit_text("⏳ Reading file with SUPER PARSER...")
+            files = await load_document(document)
         
-        # Parse to check validity
-        categories = parse_txt_content(txt_content)
-        
-        if not categories or all(len(items) == 0 for items in categories.values()):
-            await update.message.reply_text(
+        if not files:
+            await status.edit_text(
                 "❌ No valid content found!\n\n"
                 "Make sure file has URLs (http:// or https://)"
             )
@@ -958,41 +2364,69 @@ async def receive_txt_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Store data
         user_data_store[user_id] = {
-            'txt_content': txt_content,
-            'categories': categories
+            'files': files
         }
         
-        # Count items
-        total = sum(len(items) for items in categories.values())
-        total_videos = sum(1 for cat in categories.values() for item in cat if item['type'] == 'VIDEO')
-        total_pdfs = sum(1 for cat in categories.values() for item in cat if item['type'] == 'PDF')
-        
-        # Show preview
-        preview_text = "✅ File parsed successfully!\n\n📊 Detection:\n"
-        preview_text += f"📦 Categories: {len(categories)}\n"
-        preview_text += f"📊 Total Items: {total}\n"
-        preview_text += f"🎬 Videos: {total_videos}\n"
-        preview_text += f"📄 PDFs: {total_pdfs}\n\n"
-        
-        # Show first 3 categories
-        for idx, (cat, items) in enumerate(list(categories.items())[:3]):
-            preview_text += f"\n{idx+1}. {cat}: {len(items)} items"
-        
-        if len(categories) > 3:
-            preview_text += f"\n...and {len(categories) - 3} more"
-        
-        preview_text += "\n\n🔐 Step 2: Set Password\n\nHTML password enter करें:"
+        preview_text = build_preview(files)
+        preview_text += (
+            "\n\n📎 More TXT files? Send them now to convert together."
+            "\n\n🔐 Step 2: Set Password\n\nHTML password enter करें:"
+        )
         
-        await update.message.reply_text(preview_text)
+        await status.edit_text(preview_text)
         return PASSWORD
         
     except Exception as e:
-        await update.message.reply_text(
+        await status.edit_text(
             f"❌ Error: {str(e)}\n\n"
             "कृपया valid TXT file भेजें!"
         )
         return TXT_FILE
 
+@track_handler
+async def receive_more_files(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Add more TXT files or ZIP archives to the current batch"""
+    user_id = update.effective_user.id
+    document = update.message.document
+    
+    if user_id not in user_data_store:
+        await update.message.reply_text("❌ Error! /start से फिर शुरू करें।")
+        return ConversationHandler.END
+    
+    error = is_allowed_document(document)
+    if error:
+        await update.message.reply_text(f"❌ {error}")
+        return PASSWORD
+    
+    files = user_data_store[user_id]['files']
+    
+    async def on_wait(position, seconds):
+        await update.message.reply_text(admission_notice(position, seconds))
+    
+    try:
+        async with memory_budget.reserve(upload_memory_estimate(document), on_wait):
+            new_files = await load_document(document)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+        return PASSWORD
+    
+    if len(files) + len(new_files) > MAX_BATCH_FILES:
+        await update.message.reply_text(f"❌ Too many files! Max {MAX_BATCH_FILES} per batch")
+        return PASSWORD
+    
+    files.extend(new_files)
+    
+    warnings = [f"{file['name']}: {warning}" for file in new_files for warning in parse_warnings(file['report'])]
+    
+    await update.message.reply_text(
+        f"➕ Added {len(new_files)} file(s)\n"
+        f"📁 Files: {len(files)} | 📊 Items: {count_items(files)}\n\n"
+        + ''.join(f"{warning}\n\n" for warning in warnings)
+        + "🔐 Send more files or enter HTML password:"
+    )
+    return PASSWORD
+
+@track_handler
 async def receive_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Receive password"""
     user_id = update.effective_user.id
@@ -1017,6 +2451,7 @@ async def receive_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(msg)
     return BATCH_NAME
 
+@track_handler
 async def receive_batch_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Receive batch name"""
     user_id = update.effective_user.id
@@ -1037,6 +2472,7 @@ async def receive_batch_name(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await update.message.reply_text(msg)
     return CREDIT_NAME
 
+@track_handler
 async def receive_credit_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Receive credit name and show confirmation"""
     user_id = update.effective_user.id
@@ -1047,10 +2483,12 @@ async def receive_credit_name(update: Update, context: ContextTypes.DEFAULT_TYPE
         return ConversationHandler.END
     
     user_data_store[user_id]['credit_name'] = credit_name
+    user_data_store[user_id]['formats'] = default_formats()
     user_data = user_data_store[user_id]
     
     # Create confirmation message
-    total_items = sum(len(items) for items in user_data['categories'].values())
+    files = user_data['files']
+    total_categories = sum(len(file['categories']) for file in files)
     
     msg = (
         "✅ All details received!\n\n"
@@ -1058,17 +2496,169 @@ async def receive_credit_name(update: Update, context: ContextTypes.DEFAULT_TYPE
         f"🔒 Password: {user_data['password']}\n"
         f"📚 Batch: {user_data['batch_name']}\n"
         f"👨‍💻 Credit: {credit_name}\n"
-        f"📊 Categories: {len(user_data['categories'])}\n"
-        f"📊 Total Items: {total_items}\n\n"
+        + (f"📁 Files: {len(files)}\n" if len(files) > 1 else "")
+        + f"📊 Categories: {total_categories}\n"
+        f"📊 Total Items: {count_items(files)}\n\n"
+        "📦 Tap formats to select, JSON and M3U hold plain (unencrypted) links\n\n"
         "Click Convert! 👇"
     )
     
-    keyboard = [[InlineKeyboardButton("✨ Convert to HTML", callback_data='convert')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await update.message.reply_text(msg, reply_markup=format_keyboard(user_data['formats']))
+    return CONFIRM
+
+def default_formats():
+    """OUTPUT_FORMATS that exist, HTML when none does"""
+    formats = [fmt for fmt in OUTPUT_SINKS if fmt in OUTPUT_FORMATS]
+    return formats or ['html']
+
+def format_keyboard(formats):
+    """Format toggles plus the Convert button"""
+    keyboard = [
+        [
+            InlineKeyboardButton(f"{'✅' if fmt in formats else '⬜'} {sink.label}", callback_data=f'format:{fmt}')
+            for fmt, sink in OUTPUT_SINKS.items()
+        ],
+        [InlineKeyboardButton("✨ Convert", callback_data='convert')]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+@track_handler
+async def toggle_format(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Select or deselect an output format on the confirm step"""
+    query = update.callback_query
+    user_id = query.from_user.id
     
-    await update.message.reply_text(msg, reply_markup=reply_markup)
+    if user_id not in user_data_store:
+        await query.message.reply_text("❌ Error! /start से फिर शुरू करें।")
+        return ConversationHandler.END
+    
+    fmt = query.data.split(':', 1)[1]
+    formats = user_data_store[user_id]['formats']
+    if fmt in formats:
+        if len(formats) == 1:
+            await query.answer("Select at least one format!")
+            return CONFIRM
+        formats.remove(fmt)
+    elif fmt in OUTPUT_SINKS:
+        formats.append(fmt)
+    # Keep delivery order stable
+    formats.sort(key=list(OUTPUT_SINKS).index)
+    
+    await query.answer()
+    await query.edit_message_reply_markup(format_keyboard(formats))
     return CONFIRM
 
+def result_cache_key(user_data):
+    """Hash of parsed content plus password, batch name, credit and formats"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([
+        user_data['password'],
+        user_data['batch_name'],
+        user_data['credit_name'],
+        user_data['formats']
+    ]).encode('utf-8'))
+    for file in user_data['files']:
+        digest.update(json.dumps([file['name'], file['categories']]).encode('utf-8'))
+    return digest.hexdigest()
+
+def remember_result(key, file_ids):
+    """Store file_ids of a sent result, evicting the oldest entries"""
+    result_cache[key] = file_ids
+    result_cache.move_to_end(key)
+    while len(result_cache) > RESULT_CACHE_SIZE:
+        result_cache.popitem(last=False)
+
+async def render_output(user_data):
+    """
+    Export every file in the selected formats
+    Returns ([(file object, filename)], encrypted data per file)
+    Single file is one document per format, bulk uploads are one ZIP
+    """
+    files = user_data['files']
+    formats = user_data['formats']
+    
+    # Export every file concurrently, each in one pass over its items
+    results = await asyncio.gather(*(
+        asyncio.to_thread(
+            convert_file,
+            file['categories'],
+            user_data['password'],
+            user_data['batch_name'] if len(files) == 1 else f"{user_data['batch_name']} - {file['name']}",
+            user_data['credit_name'],
+            formats
+        )
+        for file in files
+    ))
+    encrypted_files = [encrypted_data for encrypted_data, _ in results]
+    file_outputs = [outputs for _, outputs in results]
+    
+    # Single file is sent as one document per format, bulk uploads as one ZIP
+    documents = []
+    if len(files) == 1:
+        for fmt, content in file_outputs[0].items():
+            output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+            output.write(content.encode('utf-8'))
+            OUTPUT_BYTES.observe(output.tell())
+            output.seek(0)
+            documents.append((output, f"{user_data['batch_name'].replace(' ', '_')}.{fmt}"))
+    elif any(file_outputs):
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        used_names = set()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for file, outputs in zip(files, file_outputs):
+                # Formats of one file share the name, e.g. Maths.html + Maths.json
+                name = file['name'].replace(' ', '_')
+                base_name = name
+                counter = 1
+                while base_name in used_names:
+                    counter += 1
+                    base_name = f"{name}_{counter}"
+                used_names.add(base_name)
+                for fmt, content in outputs.items():
+                    archive.writestr(f"{base_name}.{fmt}", content)
+        OUTPUT_BYTES.observe(output.tell())
+        output.seek(0)
+        documents.append((output, f"{user_data['batch_name'].replace(' ', '_')}.zip"))
+    
+    if not documents:
+        raise ValueError("Nothing to export in the selected formats (M3U needs VIDEO links)")
+    return documents, encrypted_files
+
+async def send_documents(message, documents, caption):
+    """
+    Reply with [(file_id or bytes, filename)], several as one album with the
+    caption on the last document, returns the sent file_ids
+    """
+    if len(documents) == 1:
+        document, filename = documents[0]
+        sent = await message.reply_document(document=document, filename=filename, caption=caption)
+        return [sent.document.file_id] if sent.document else []
+    
+    sent = await message.reply_media_group(media=[
+        InputMediaDocument(document, filename=filename, caption=caption if index == len(documents) - 1 else None)
+        for index, (document, filename) in enumerate(documents)
+    ])
+    return [item.document.file_id for item in sent if item.document]
+
+async def store_batch(batch_id, user_id, user_data, encrypted_data=None):
+    """Keep encrypted model of a single-file conversion for /append"""
+    if encrypted_data is None:
+        encrypted_data = await asyncio.to_thread(
+            encode_categories, user_data['files'][0]['categories'], user_data['password']
+        )
+    batch = {
+        'owner': user_id,
+        'password': user_data['password'],
+        'batch_name': user_data['batch_name'],
+        'credit_name': user_data['credit_name'],
+        'categories': encrypted_data
+    }
+    try:
+        await asyncio.to_thread(save_batch, batch_id, batch)
+    except OSError as e:
+        print(f"Could not store batch {batch_id}: {e}")
+
+@track_handler
 async def process_conversion(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process the conversion"""
     query = update.callback_query
@@ -1079,61 +2669,216 @@ async def process_conversion(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return ConversationHandler.END
     
     await query.answer()
-    msg = await query.message.reply_text("⚡ Converting to HTML...\n⏳ Please wait...")
+    # Reuse the summary message as status instead of sending a new one
+    msg = query.message
+    await msg.edit_text("⚡ Converting to HTML...\n📤 Your file will arrive below!")
     
+    CONVERSIONS_IN_PROGRESS.inc()
     try:
         user_data = user_data_store[user_id]
+        files = user_data['files']
         
-        # Generate HTML
-        html_content = generate_html(
-            user_data['categories'],
-            user_data['password'],
-            user_data['batch_name'],
-            user_data['credit_name']
-        )
+        total = count_items(files)
+        formats = user_data['formats']
         
-        # Save HTML file
-        filename = f"{user_data['batch_name'].replace(' ', '_')}.html"
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        # Single-file HTML batches get an id so new links can be appended later
+        batch_id = secrets.token_hex(5) if len(files) == 1 and 'html' in formats else None
         
-        await msg.edit_text("✅ HTML generated!\n📤 Sending file...")
-        
-        # Send HTML file
-        total = sum(len(items) for items in user_data['categories'].values())
+        ready = "✅ HTML File Ready!" if formats == ['html'] else f"✅ Files Ready ({', '.join(OUTPUT_SINKS[fmt].label for fmt in formats)})!"
         caption = (
-            f"✅ HTML File Ready!\n\n"
+            f"{ready}\n\n"
             f"🔒 Password: {user_data['password']}\n"
             f"📚 Batch: {user_data['batch_name']}\n"
             f"👨‍💻 Credit: {user_data['credit_name']}\n"
-            f"📊 Items: {total}\n\n"
+            + (f"📁 Files: {len(files)}\n" if len(files) > 1 else "")
+            + f"📊 Items: {total}\n\n"
             f"⚡ All {total} links detected!\n"
-            f"🎨 7 themes available!"
+            f"🎨 7 themes available!\n\n"
+            + (f"🆔 Batch ID: {batch_id}\n➕ /append {batch_id} to add new links (kept {BATCH_TTL_DAYS:g} days after the last update)\n\n" if batch_id else "")
+            + "🎉 Conversion Complete! /start for another file!"
         )
         
-        with open(filename, 'rb') as f:
-            await query.message.reply_document(
-                document=f,
-                filename=filename,
-                caption=caption
-            )
+        # Same content and settings already sent? Re-send by file_id, no render or upload
+        cache_key = result_cache_key(user_data)
+        file_ids = result_cache.get(cache_key)
+        if file_ids:
+            try:
+                await send_documents(query.message, [(file_id, None) for file_id in file_ids], caption)
+                RESULT_CACHE_LOOKUPS.inc(result='hit')
+                result_cache.move_to_end(cache_key)
+                if batch_id:
+                    await store_batch(batch_id, user_id, user_data)
+                del user_data_store[user_id]
+                return ConversationHandler.END
+            except TelegramError as e:
+                print(f"Cached file_id failed, rendering again: {e}")
+                result_cache.pop(cache_key, None)
+        RESULT_CACHE_LOOKUPS.inc(result='miss')
+        
+        async with memory_budget.reserve(total * RENDER_BYTES_PER_ITEM, edit_queue_status(msg)) as reservation:
+            if reservation.waited:
+                await msg.edit_text("⚡ Converting to HTML...\n📤 Your file will arrive below!")
+            
+            documents, encrypted_files = await render_output(user_data)
+            
+            # In-memory spool has no name, which InputFile can't handle - send bytes
+            try:
+                file_ids = await send_documents(
+                    query.message,
+                    [(output.read(), filename) for output, filename in documents],
+                    caption
+                )
+            finally:
+                for output, _ in documents:
+                    output.close()
+        
+        if len(file_ids) == len(documents):
+            remember_result(cache_key, file_ids)
+        
+        if batch_id:
+            await store_batch(batch_id, user_id, user_data, encrypted_files[0])
         
         # Cleanup
-        os.remove(filename)
         del user_data_store[user_id]
         
-        await query.message.reply_text(
-            "🎉 Conversion Complete!\n\n"
-            "✅ HTML file sent!\n"
-            "/start for another file!"
-        )
-        
     except Exception as e:
         await msg.edit_text(f"❌ Error: {str(e)}")
         print(f"Error in conversion: {e}")
+    finally:
+        CONVERSIONS_IN_PROGRESS.dec()
     
     return ConversationHandler.END
 
+@track_handler
+async def start_append(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Start appending new links to a stored batch: /append <batch_id>"""
+    user_id = update.effective_user.id
+    batch_id = context.args[0].strip() if context.args else ''
+    
+    batch = await asyncio.to_thread(load_batch, batch_id)
+    if not batch or batch['owner'] != user_id:
+        await update.message.reply_text(
+            "❌ Batch not found!\n\n"
+            "Usage: /append <batch_id>\n"
+            "Batch ID is in the caption of your HTML file.\n"
+            f"Batches expire {BATCH_TTL_DAYS:g} days after their last update."
+        )
+        return ConversationHandler.END
+    
+    # Stored size is remembered for the memory estimate of the update
+    total = sum(len(items) for items in batch['categories'].values())
+    user_data_store[user_id] = {'append_batch': batch_id, 'append_items': total}
+    
+    await update.message.reply_text(
+        f"📚 Batch: {batch['batch_name']}\n"
+        f"📊 Items: {total}\n\n"
+        "📄 Send TXT file with only the NEW links\n"
+        "Existing links are kept, duplicates are skipped."
+    )
+    return APPEND_FILE
+
+@track_handler
+async def receive_append_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Merge a delta TXT file into a stored batch and send updated HTML"""
+    user_id = update.effective_user.id
+    document = update.message.document
+    
+    if user_id not in user_data_store or 'append_batch' not in user_data_store[user_id]:
+        await update.message.reply_text("❌ Error! /start से फिर शुरू करें।")
+        return ConversationHandler.END
+    
+    error = is_allowed_document(document)
+    if error:
+        await update.message.reply_text(f"❌ {error}\n\nकृपया valid TXT file भेजें!")
+        return APPEND_FILE
+    
+    status = await update.message.reply_text("⏳ Reading new links...")
+    batch_id = user_data_store[user_id]['append_batch']
+    
+    try:
+        # Parsing the delta and rendering the whole stored batch
+        estimate = upload_memory_estimate(document) + user_data_store[user_id].get('append_items', 0) * RENDER_BYTES_PER_ITEM
+        async with memory_budget.reserve(estimate, edit_queue_status(status)) as reservation:
+            if reservation.waited:
+                await status.edit_text("⏳ Reading new links...")
+            files = await load_document(document)
+            if not files:
+                await status.edit_text(
+                    "❌ No valid content found!\n\n"
+                    "Make sure file has URLs (http:// or https://)"
+                )
+                return APPEND_FILE
+            
+            batch = await asyncio.to_thread(load_batch, batch_id)
+            # Expired or pruned from the store since /append
+            if batch is None:
+                await status.edit_text(
+                    "❌ Batch not found!\n\n"
+                    f"Batches expire {BATCH_TTL_DAYS:g} days after their last update."
+                )
+                del user_data_store[user_id]
+                return ConversationHandler.END
+            
+            # Only new links are encrypted, stored ones are reused as they are
+            added = duplicates = 0
+            for file in files:
+                file_added, file_duplicates = merge_categories(batch['categories'], file['categories'], batch['password'])
+                added += file_added
+                duplicates += file_duplicates
+            
+            if added == 0:
+                await status.edit_text(f"ℹ️ No new links! {duplicates} link(s) already in batch.")
+                del user_data_store[user_id]
+                return ConversationHandler.END
+            
+            await status.edit_text("⚡ Updating HTML...\n📤 Your file will arrive below!")
+            
+            html_content = await asyncio.to_thread(
+                render_html,
+                batch['categories'],
+                batch['password'],
+                batch['batch_name'],
+                batch['credit_name']
+            )
+            await asyncio.to_thread(save_batch, batch_id, batch)
+            
+            output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+            output.write(html_content.encode('utf-8'))
+            OUTPUT_BYTES.observe(output.tell())
+            output.seek(0)
+            
+            total = sum(len(items) for items in batch['categories'].values())
+            caption = (
+                f"✅ HTML File Updated!\n\n"
+                f"🔒 Password: {batch['password']}\n"
+                f"📚 Batch: {batch['batch_name']}\n"
+                f"👨‍💻 Credit: {batch['credit_name']}\n"
+                f"➕ New Items: {added}\n"
+                + (f"♻️ Duplicates skipped: {duplicates}\n" if duplicates else "")
+                + f"📊 Total Items: {total}\n\n"
+                + ''.join(f"{warning}\n\n" for file in files for warning in parse_warnings(file['report']))
+                + f"🆔 Batch ID: {batch_id}\n"
+                f"➕ /append {batch_id} to add more links"
+            )
+            
+            with output:
+                await update.message.reply_document(
+                    document=output.read(),
+                    filename=f"{batch['batch_name'].replace(' ', '_')}.html",
+                    caption=caption
+                )
+        
+        del user_data_store[user_id]
+        return ConversationHandler.END
+        
+    except Exception as e:
+        await status.edit_text(
+            f"❌ Error: {str(e)}\n\n"
+            "कृपया valid TXT file भेजें!"
+        )
+        return APPEND_FILE
+
+@track_handler
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel conversation"""
     user_id = update.effective_user.id
@@ -1146,35 +2891,143 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors"""
     print(f"Error: {context.error}")
+    HANDLER_ERRORS.inc(error=type(context.error).__name__)
     if update and update.effective_message:
         await update.effective_message.reply_text(
             "❌ Error occurred! /start to retry."
         )
 
-def main():
-    """Start the bot"""
-    TOKEN = os.getenv('BOT_TOKEN')
+class Throttle:
+    """Space out calls evenly so at most `rate` happen per `period` seconds"""
     
-    if not TOKEN:
-        print("❌ BOT_TOKEN environment variable not set!")
-        return
+    def __init__(self, rate, period=1.0):
+        self.interval = period / rate
+        self._next_slot = 0.0
     
-    print("🚀 Starting SUPER PARSER Bot...")
+    async def wait(self):
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+    
+    def idle(self, now):
+        """No slot booked ahead, same as a fresh Throttle"""
+        return self._next_slot <= now
+
+class FloodControlRateLimiter(BaseRateLimiter):
+    """
+    Keep outgoing Bot API calls under Telegram flood limits
+    - Global limit across all chats
+    - Per-group limit (groups have a lower limit)
+    - On 429, waits `retry_after` seconds and retries
+    """
+    
+    def __init__(self, global_rate=GLOBAL_RATE_LIMIT, group_rate=GROUP_RATE_LIMIT, max_retries=FLOOD_MAX_RETRIES):
+        self._global = Throttle(global_rate)
+        self._group_rate = group_rate
+        # chat_id -> Throttle, least recently used first
+        self._groups = OrderedDict()
+        self._max_retries = max_retries
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        self._groups.clear()
     
-    application = Application.builder().token(TOKEN).build()
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        try:
+            return await self._process_request(callback, args, kwargs, endpoint, data)
+        except TelegramError as e:
+            API_ERRORS.inc(endpoint=endpoint, error=type(e).__name__)
+            raise
+    
+    async def _process_request(self, callback, args, kwargs, endpoint, data):
+        # Long polling is not a message, never throttle it
+        if endpoint == 'getUpdates':
+            return await callback(*args, **kwargs)
+        
+        chat_id = data.get('chat_id')
+        group = None
+        if isinstance(chat_id, str) or (isinstance(chat_id, int) and chat_id < 0):
+            group = self._groups.get(chat_id)
+            if group is None:
+                # Idle throttles carry no state, drop them instead of keeping one per chat forever
+                now = asyncio.get_running_loop().time()
+                while self._groups and next(iter(self._groups.values())).idle(now):
+                    self._groups.popitem(last=False)
+                group = self._groups[chat_id] = Throttle(self._group_rate, 60.0)
+            else:
+                self._groups.move_to_end(chat_id)
+        
+        for attempt in range(self._max_retries + 1):
+            if group is not None:
+                await group.wait()
+            await self._global.wait()
+            
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self._max_retries:
+                    raise
+                API_ERRORS.inc(endpoint=endpoint, error='RetryAfter')
+                print(f"⚠️ Flood limit on {endpoint}, retrying in {e.retry_after}s")
+                await asyncio.sleep(e.retry_after + 0.1)
+
+async def close_download_client(application):
+    """Close shared download client on shutdown"""
+    global download_client
+    if download_client is not None:
+        await download_client.aclose()
+        download_client = None
+
+def build_application(token, base_url=None, base_file_url=None, rate_limiter=None, local_mode=False):
+    """
+    Build the Application with all handlers
+    base_url/base_file_url point the bot at another Bot API server,
+    local_mode when that server runs with --local on this machine
+    """
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .connection_pool_size(CONNECTION_POOL_SIZE)
+        .read_timeout(READ_TIMEOUT)
+        .write_timeout(WRITE_TIMEOUT)
+        .connect_timeout(CONNECT_TIMEOUT)
+        .pool_timeout(POOL_TIMEOUT)
+        .rate_limiter(rate_limiter or FloodControlRateLimiter())
+        .post_shutdown(close_download_client)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    if base_file_url:
+        builder = builder.base_file_url(base_file_url)
+    if local_mode:
+        builder = builder.local_mode(True)
+    application = builder.build()
     
     # Conversation handler
     conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler('start', start),
+            CommandHandler('append', start_append),
             CallbackQueryHandler(button_callback, pattern='^create$')
         ],
         states={
             TXT_FILE: [MessageHandler(filters.Document.ALL, receive_txt_file)],
-            PASSWORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_password)],
+            PASSWORD: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, receive_password),
+                MessageHandler(filters.Document.ALL, receive_more_files)
+            ],
             BATCH_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_batch_name)],
             CREDIT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_credit_name)],
-            CONFIRM: [CallbackQueryHandler(process_conversion, pattern='^convert$')],
+            CONFIRM: [
+                CallbackQueryHandler(process_conversion, pattern='^convert$'),
+                CallbackQueryHandler(toggle_format, pattern='^format:')
+            ],
+            APPEND_FILE: [MessageHandler(filters.Document.ALL, receive_append_file)],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
     )
@@ -1182,6 +3035,46 @@ def main():
     application.add_handler(conv_handler)
     application.add_error_handler(error_handler)
     
+    return application
+
+def main():
+    """Start the bot"""
+    TOKEN = os.getenv('BOT_TOKEN')
+    
+    if not TOKEN:
+        print("❌ BOT_TOKEN environment variable not set!")
+        return
+    
+    print("🚀 Starting SUPER PARSER Bot...")
+    
+    # Local server serves files under /file/bot<token> next to /bot<token>
+    base_file_url = BOT_API_BASE_FILE_URL
+    if BOT_API_BASE_URL and not base_file_url and BOT_API_BASE_URL.rstrip('/').endswith('/bot'):
+        base_file_url = BOT_API_BASE_URL.rstrip('/')[:-len('/bot')] + '/file/bot'
+    if BOT_API_BASE_URL:
+        print(f"🛰️ Bot API server: {BOT_API_BASE_URL}" + (" (local mode)" if BOT_API_LOCAL_MODE else ""))
+    
+    application = build_application(
+        TOKEN,
+        base_url=BOT_API_BASE_URL,
+        base_file_url=base_file_url,
+        local_mode=BOT_API_LOCAL_MODE
+    )
+    
+    if METRICS_PORT:
+        metrics.Gauge(
+            'bot_update_queue_depth',
+            'Updates waiting for a free processing slot',
+            func=lambda: application.update_processor.slot_waiting
+        )
+        metrics.Gauge(
+            'bot_updates_waiting',
+            'Updates waiting for an earlier update from the same user',
+            func=lambda: application.update_processor.waiting
+        )
+        metrics.start_http_server(int(METRICS_PORT), METRICS_HOST)
+        print(f"📈 Metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    
     print("✅ Bot started successfully!")
     print("🎯 Waiting for messages...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
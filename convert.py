@@ -0,0 +1,224 @@
+"""
+Offline batch converter - TXT to password-protected HTML without Telegram
+
+Usage:
+    python convert.py lectures.txt -p secret -c @FR_SAMMM11
+    python convert.py exports/ -p secret -c @FR_SAMMM11 -o html/ -j 8
+    cat batch.txt | python convert.py - -p secret -b "My Batch" -c @FR_SAMMM11
+    python convert.py -m manifest.json -o html/
+    python convert.py lectures.txt -p secret -c @FR_SAMMM11 -f html,json,m3u
+
+Formats (-f): html (password-protected page), json (compact manifest) and
+m3u (playlist of VIDEO links), written next to each other as name.<format>
+from one pass over the parsed links. JSON and M3U hold plain links.
+
+Manifest is a JSON list, one entry per file (relative paths are resolved
+against the manifest folder and kept under the output folder, missing
+settings fall back to the CLI args):
+    [
+        {"file": "maths.txt", "password": "1234", "batch_name": "Maths", "credit_name": "@me"},
+        {"file": "physics/part1.txt", "batch_name": "Physics", "formats": ["html", "m3u"]}
+    ]
+
+Two inputs that would write the same output name are refused.
+"""
+import os
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bot import parse_txt_content, parse_warnings, convert_file, probe_unclassified, OUTPUT_SINKS
+
+def convert_job(job):
+    """
+    Convert one TXT file (runs in a worker process)
+    Returns (output paths, item count, input bytes, output bytes, parser warnings)
+    """
+    if job.get('content') is not None:
+        content = job['content']
+    else:
+        with open(job['file'], 'r', encoding='utf-8') as f:
+            content = f.read()
+    
+    # Parser prints stats for the bot logs, keep CLI output clean
+    report = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        categories = parse_txt_content(content, report)
+    
+    total = sum(len(items) for items in categories.values())
+    if total == 0:
+        raise ValueError("No valid content found!")
+    
+    if job.get('probe'):
+        asyncio.run(probe_unclassified(categories))
+    
+    _, outputs = convert_file(
+        categories,
+        job['password'],
+        job['batch_name'],
+        job['credit_name'],
+        job['formats']
+    )
+    if not outputs:
+        raise ValueError("Nothing to export in the selected formats (M3U needs VIDEO links)")
+    
+    output = Path(job['output'])
+    output.parent.mkdir(parents=True, exist_ok=True)
+    paths = []
+    size_out = 0
+    for fmt, exported in outputs.items():
+        path = output.with_suffix(f'.{fmt}')
+        data = exported.encode('utf-8')
+        path.write_bytes(data)
+        paths.append(str(path))
+        size_out += len(data)
+    
+    return paths, total, len(content.encode('utf-8')), size_out, parse_warnings(report)
+
+def parse_formats(value):
+    """'html,json' or ['html', 'json'] -> ['html', 'json'] in delivery order"""
+    if not isinstance(value, str):
+        value = ','.join(map(str, value))
+    formats = [fmt.strip().lower() for fmt in value.split(',') if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in OUTPUT_SINKS]
+    if unknown or not formats:
+        raise SystemExit(f"❌ Unknown format: {value!r} (choose from {', '.join(OUTPUT_SINKS)})")
+    return [fmt for fmt in OUTPUT_SINKS if fmt in formats]
+
+def collect_jobs(args):
+    """Build job list from CLI inputs and manifest"""
+    defaults = {
+        'password': args.password,
+        'batch_name': args.batch_name,
+        'credit_name': args.credit_name,
+    }
+    output_dir = Path(args.output_dir)
+    jobs = []
+    
+    def add_job(source, relative, content=None, **settings):
+        job = {key: settings.get(key) or value for key, value in defaults.items()}
+        job['batch_name'] = job['batch_name'] or Path(relative).stem
+        job['file'] = source
+        job['content'] = content
+        job['probe'] = args.probe
+        job['formats'] = parse_formats(settings.get('formats') or args.formats)
+        # Output keeps the path relative to the input folder or manifest, only
+        # .txt is swapped for .html so names like "Batch 1.5" stay whole
+        relative = Path(relative)
+        if relative.suffix.lower() == '.txt':
+            output_name = relative.with_suffix('.html')
+        else:
+            output_name = relative.parent / f"{relative.name}.html"
+        output_name = settings.get('output') or output_name
+        job['output'] = str(output_dir / output_name)
+        jobs.append(job)
+    
+    for source in args.inputs:
+        if source == '-':
+            stdin_name = (args.batch_name or 'batch').replace(' ', '_')
+            add_job('<stdin>', stdin_name, content=sys.stdin.read())
+            continue
+        
+        path = Path(source)
+        if path.is_dir():
+            for txt_path in sorted(path.rglob('*.txt')):
+                add_job(str(txt_path), txt_path.relative_to(path))
+        elif path.is_file():
+            add_job(str(path), path.name)
+        else:
+            raise SystemExit(f"❌ Not found: {source}")
+    
+    if args.manifest:
+        manifest_path = Path(args.manifest)
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        for entry in entries:
+            path = manifest_path.parent / entry['file']
+            relative = Path(entry['file'])
+            # Paths outside the manifest folder can't be mirrored under the output folder
+            if relative.is_absolute() or '..' in relative.parts:
+                relative = Path(relative.name)
+            add_job(str(path), relative, **entry)
+    
+    # Same output name would silently overwrite an earlier file
+    outputs = {}
+    for job in jobs:
+        output = str(Path(job['output']).with_suffix(''))
+        if output in outputs:
+            raise SystemExit(
+                f"❌ {outputs[output]} and {job['file']} both write {output}.*, "
+                "rename one or give the manifest entry an \"output\""
+            )
+        outputs[output] = job['file']
+    
+    for job in jobs:
+        if not job['password'] or len(job['password']) < 4:
+            raise SystemExit(f"❌ {job['file']}: password must be at least 4 characters")
+        if not job['credit_name']:
+            raise SystemExit(f"❌ {job['file']}: credit name is required")
+    
+    return jobs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert TXT link files to password-protected HTML")
+    parser.add_argument('inputs', nargs='*', help="TXT files, folders (searched for *.txt) or - for stdin")
+    parser.add_argument('-p', '--password', help="HTML password")
+    parser.add_argument('-b', '--batch-name', help="Batch name (default: file name)")
+    parser.add_argument('-c', '--credit-name', help="Developer credit")
+    parser.add_argument('-m', '--manifest', help="JSON manifest with per-file settings")
+    parser.add_argument('-o', '--output-dir', default='.', help="Output folder (default: current folder)")
+    parser.add_argument('-f', '--formats', default='html', help="Comma-separated output formats: html, json, m3u (default: html)")
+    parser.add_argument('--probe', action='store_true', help="Probe Content-Type of links without a known extension")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help="Worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    
+    if not args.inputs and not args.manifest:
+        parser.error("give at least one input or --manifest")
+    
+    jobs = collect_jobs(args)
+    if not jobs:
+        print("❌ No TXT files found!", file=sys.stderr)
+        return 1
+    
+    print(f"🚀 Converting {len(jobs)} file(s) with {args.workers} worker(s)...", file=sys.stderr)
+    
+    started = time.perf_counter()
+    done = failed = total_items = bytes_in = bytes_out = 0
+    
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(convert_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            done += 1
+            try:
+                outputs, items, size_in, size_out, warnings = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[{done}/{len(jobs)}] ❌ {job['file']}: {e}", file=sys.stderr)
+                continue
+            total_items += items
+            bytes_in += size_in
+            bytes_out += size_out
+            print(f"[{done}/{len(jobs)}] ✅ {job['file']} → {', '.join(outputs)} ({items} items)", file=sys.stderr)
+            for warning in warnings:
+                print(f"    {warning}", file=sys.stderr)
+    
+    elapsed = time.perf_counter() - started
+    print(
+        f"\n📊 Done: {done - failed} converted, {failed} failed in {elapsed:.2f}s\n"
+        f"📦 Items: {total_items}\n"
+        f"⚡ Throughput: {(done - failed) / elapsed:.1f} files/s, "
+        f"{total_items / elapsed:.0f} items/s, {bytes_in / elapsed / (1024 * 1024):.2f} MB/s in "
+        f"({bytes_out / (1024 * 1024):.2f} MB written)",
+        file=sys.stderr
+    )
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
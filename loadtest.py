@@ -0,0 +1,443 @@
+"""
+Load test - runs the real bot against a fake Bot API server on localhost
+
+Simulates N users going through the full flow at the same time:
+/start -> Create HTML -> upload TXT -> password -> batch -> credit -> Convert
+
+Usage:
+    python loadtest.py --users 50 --links 300
+
+Saturation - more uploads waiting for memory budget than update slots,
+bystanders only go /start -> Create HTML -> /cancel and must still get answers:
+    python loadtest.py --users 20 --links 5000 --slots 4 --memory-budget 1 --bystanders 10
+
+The fake Bot API server and the simulated users run in a child process,
+so the reported peak RSS is the bot's own memory use.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import itertools
+import statistics
+import multiprocessing
+from email import policy
+from email.parser import BytesParser
+from urllib.parse import parse_qs, urlsplit
+
+TOKEN = '123456:LOADTEST'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Load Test Bot', 'username': 'loadtest_bot'}
+
+# Step name -> check that the bot finished answering it
+STEPS = [
+    ('start', lambda method, params: method == 'sendMessage' and 'Welcome' in params.get('text', '')),
+    ('create', lambda method, params: method == 'sendMessage' and 'Step 1' in params.get('text', '')),
+    ('upload', lambda method, params: method in ('sendMessage', 'editMessageText') and 'Step 2' in params.get('text', '')),
+    ('password', lambda method, params: method == 'sendMessage' and 'Step 3' in params.get('text', '')),
+    ('batch', lambda method, params: method == 'sendMessage' and 'Step 4' in params.get('text', '')),
+    ('credit', lambda method, params: method == 'sendMessage' and 'Click Convert' in params.get('text', '')),
+    ('convert', lambda method, params: method == 'sendDocument'),
+]
+
+# Bystanders start once every upload has been sent
+BYSTANDER_STEPS = [
+    ('start', STEPS[0][1]),
+    ('create', STEPS[1][1]),
+    ('cancel', lambda method, params: method == 'sendMessage' and 'Cancelled' in params.get('text', '')),
+]
+
+class FakeBotApi:
+    """Just enough of the Bot API for the conversation flow"""
+    
+    def __init__(self):
+        self.updates = []
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.new_update = asyncio.Event()
+        self.files = {}
+        # chat_id -> queue of (method, params) sent by the bot
+        self.outbox = {}
+        self.bytes_uploaded = 0
+        self.uploads_sent = 0
+        self.all_uploads_sent = asyncio.Event()
+    
+    def chat_outbox(self, chat_id):
+        return self.outbox.setdefault(chat_id, asyncio.Queue())
+    
+    def push_update(self, **update):
+        update['update_id'] = next(self.update_ids)
+        self.updates.append(update)
+        self.new_update.set()
+    
+    def message(self, chat_id, **fields):
+        return {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            **fields
+        }
+    
+    async def get_updates(self, params):
+        offset = int(params.get('offset', 0) or 0)
+        timeout = float(params.get('timeout', 0) or 0)
+        self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        if not self.updates and timeout:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:100]
+    
+    async def call(self, method, params):
+        """Handle one Bot API method, returns the result"""
+        if method == 'getUpdates':
+            return await self.get_updates(params)
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getFile':
+            file_id = params['file_id']
+            return {
+                'file_id': file_id,
+                'file_unique_id': file_id,
+                'file_size': len(self.files[file_id]),
+                'file_path': f"documents/{file_id}.txt"
+            }
+        
+        chat_id = int(params['chat_id']) if 'chat_id' in params else None
+        if method in ('sendMessage', 'editMessageText'):
+            result = self.message(chat_id, text=params.get('text', ''))
+        elif method == 'sendDocument':
+            file_id = f"sent{next(self.message_ids)}"
+            result = self.message(chat_id, document={'file_id': file_id, 'file_unique_id': file_id})
+        else:
+            # answerCallbackQuery, deleteWebhook, ...
+            result = True
+        
+        if chat_id is not None:
+            self.chat_outbox(chat_id).put_nowait((method, params))
+        return result
+    
+    async def handle_connection(self, reader, writer):
+        """Minimal HTTP/1.1 server with keep-alive"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                http_method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                self.bytes_uploaded += len(body)
+                status, content_type, payload = await self.route(http_method, path, headers, body)
+                
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode('latin-1') + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Client went away or server is shutting down
+            pass
+        finally:
+            writer.close()
+    
+    async def route(self, http_method, path, headers, body):
+        path = urlsplit(path).path
+        
+        # File downloads: /file/bot<token>/documents/<file_id>.txt
+        if path.startswith(f"/file/bot{TOKEN}/"):
+            file_id = os.path.splitext(os.path.basename(path))[0]
+            if file_id not in self.files:
+                return '404 Not Found', 'text/plain', b'not found'
+            return '200 OK', 'text/plain', self.files[file_id]
+        
+        prefix = f"/bot{TOKEN}/"
+        if not path.startswith(prefix):
+            return '404 Not Found', 'text/plain', b'not found'
+        
+        method = path[len(prefix):]
+        params = parse_params(headers.get('content-type', ''), body)
+        result = await self.call(method, params)
+        return '200 OK', 'application/json', json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+def parse_params(content_type, body):
+    """Bot API parameters from a form or multipart body"""
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=policy.default).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body
+        )
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if part.get_filename() is None:
+                params[name] = part.get_content()
+        return params
+    return {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+
+def make_txt(user_id, links):
+    """Unique TXT per user so result cache never hits"""
+    lines = [
+        f"[Chapter {j // 25 + 1}] Lecture {j + 1}: https://cdn.example.com/u{user_id}/lecture{j}.mp4"
+        if j % 5 else
+        f"[Chapter {j // 25 + 1}] Notes {j + 1}: https://cdn.example.com/u{user_id}/notes{j}.pdf"
+        for j in range(links)
+    ]
+    return '\n'.join(lines).encode('utf-8')
+
+def command(text):
+    return {'text': text, 'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]}
+
+async def run_steps(api, chat_id, steps, actions, timeout, latencies):
+    """Send each step and wait for the bot to finish answering it"""
+    outbox = api.chat_outbox(chat_id)
+    last_message = {}
+    for step, is_done in steps:
+        started = time.perf_counter()
+        actions[step](last_message)
+        while True:
+            method, params = await asyncio.wait_for(outbox.get(), timeout)
+            if method in ('sendMessage', 'editMessageText'):
+                last_message.clear()
+                last_message.update(params)
+            if is_done(method, params):
+                break
+        latencies[step].append(time.perf_counter() - started)
+
+async def simulate_user(api, user_id, links, timeout, latencies, users):
+    """Run one user through the whole flow, recording latency per step"""
+    chat_id = user_id
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"}
+    
+    def user_message(**fields):
+        return {
+            'message_id': next(api.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': user,
+            **fields
+        }
+    
+    def callback(data, last_message):
+        return {
+            'id': f"{user_id}-{data}",
+            'from': user,
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': api.message(chat_id, text=last_message.get('text', ''))
+        }
+    
+    def upload(last_message):
+        api.push_update(message=user_message(document={
+            'file_id': file_id,
+            'file_unique_id': file_id,
+            'file_name': f"batch{user_id}.txt",
+            'mime_type': 'text/plain',
+            'file_size': len(api.files[file_id])
+        }))
+        api.uploads_sent += 1
+        if api.uploads_sent == users:
+            api.all_uploads_sent.set()
+    
+    file_id = f"upload{user_id}"
+    api.files[file_id] = make_txt(user_id, links)
+    
+    actions = {
+        'start': lambda last_message: api.push_update(message=user_message(**command('/start'))),
+        'create': lambda last_message: api.push_update(callback_query=callback('create', last_message)),
+        'upload': upload,
+        'password': lambda last_message: api.push_update(message=user_message(text='load1234')),
+        'batch': lambda last_message: api.push_update(message=user_message(text=f"Batch {user_id}")),
+        'credit': lambda last_message: api.push_update(message=user_message(text='@loadtest')),
+        'convert': lambda last_message: api.push_update(callback_query=callback('convert', last_message)),
+    }
+    
+    await run_steps(api, chat_id, STEPS, actions, timeout, latencies)
+
+async def simulate_bystander(api, user_id, timeout, latencies):
+    """/start, Create HTML and /cancel while the uploads are being processed"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"Bystander{user_id}"}
+    
+    def send(text):
+        api.push_update(message={
+            'message_id': next(api.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': user,
+            **command(text)
+        })
+    
+    def create(last_message):
+        api.push_update(callback_query={
+            'id': f"{user_id}-create",
+            'from': user,
+            'chat_instance': str(user_id),
+            'data': 'create',
+            'message': api.message(user_id, text=last_message.get('text', ''))
+        })
+    
+    actions = {
+        'start': lambda last_message: send('/start'),
+        'create': create,
+        'cancel': lambda last_message: send('/cancel'),
+    }
+    await api.all_uploads_sent.wait()
+    await run_steps(api, user_id, BYSTANDER_STEPS, actions, timeout, latencies)
+
+async def run_users(args, port_queue, result_queue, stop_queue):
+    api = FakeBotApi()
+    server = await asyncio.start_server(api.handle_connection, '127.0.0.1', 0)
+    port_queue.put(server.sockets[0].getsockname()[1])
+    
+    latencies = {step: [] for step, _ in STEPS}
+    bystander_latencies = {step: [] for step, _ in BYSTANDER_STEPS}
+    started = time.perf_counter()
+    
+    async def user(index):
+        await asyncio.sleep(args.ramp * index / max(args.users, 1))
+        try:
+            await simulate_user(api, 1000 + index, args.links, args.timeout, latencies, args.users)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
+    async def bystander(index):
+        try:
+            await simulate_bystander(api, 900000 + index, args.bystander_timeout, bystander_latencies)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
+    results, bystanders = await asyncio.gather(
+        asyncio.gather(*(user(index) for index in range(args.users))),
+        asyncio.gather(*(bystander(index) for index in range(args.bystanders)))
+    )
+    elapsed = time.perf_counter() - started
+    
+    result_queue.put({
+        'elapsed': elapsed,
+        'completed': sum(results),
+        'failed': len(results) - sum(results),
+        'latencies': latencies,
+        'bystanders_answered': sum(bystanders),
+        'bystander_latencies': bystander_latencies,
+        'bytes_uploaded': api.bytes_uploaded,
+    })
+    
+    # Keep answering until the bot has stopped polling
+    await asyncio.get_running_loop().run_in_executor(None, stop_queue.get)
+    server.close()
+
+def users_process(args, port_queue, result_queue, stop_queue):
+    asyncio.run(run_users(args, port_queue, result_queue, stop_queue))
+
+def percentile(values, fraction):
+    """Nearest-rank percentile"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+async def run_bot(args, port, result_queue, stop_queue):
+    import bot
+    
+    application = bot.build_application(
+        TOKEN,
+        base_url=f"http://127.0.0.1:{port}/bot",
+        base_file_url=f"http://127.0.0.1:{port}/file/bot",
+        rate_limiter=bot.FloodControlRateLimiter(global_rate=args.global_rate)
+    )
+    
+    async with application:
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+        await application.start()
+        result = await asyncio.get_running_loop().run_in_executor(None, result_queue.get)
+        await application.updater.stop()
+        await application.stop()
+    stop_queue.put(True)
+    
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the bot against a local fake Bot API")
+    parser.add_argument('-u', '--users', type=int, default=20, help="Simulated users (default: 20)")
+    parser.add_argument('-l', '--links', type=int, default=200, help="Links per uploaded TXT (default: 200)")
+    parser.add_argument('--ramp', type=float, default=0, help="Seconds over which users start (default: all at once)")
+    parser.add_argument('--timeout', type=float, default=120, help="Max seconds to wait for one step")
+    parser.add_argument('--global-rate', type=float, default=1000, help="Bot's outgoing requests/s limit (default: 1000, i.e. not the bottleneck)")
+    parser.add_argument('--slots', type=int, help="MAX_CONCURRENT_UPDATES for the bot")
+    parser.add_argument('--memory-budget', type=int, help="MEMORY_BUDGET in bytes for the bot, 1 runs uploads one at a time")
+    parser.add_argument('--bystanders', type=int, default=0, help="Extra users going /start -> Create HTML -> /cancel once all uploads are sent")
+    parser.add_argument('--bystander-timeout', type=float, default=10, help="Max seconds a bystander waits for an answer")
+    args = parser.parse_args(argv)
+    
+    # Keep /append batches out of the working folder
+    os.environ.setdefault('BATCH_STORE_DIR', tempfile.mkdtemp(prefix='loadtest-batches-'))
+    # Read by bot on import
+    if args.slots:
+        os.environ['MAX_CONCURRENT_UPDATES'] = str(args.slots)
+    if args.memory_budget:
+        os.environ['MEMORY_BUDGET'] = str(args.memory_budget)
+    
+    context = multiprocessing.get_context('spawn')
+    port_queue = context.Queue()
+    result_queue = context.Queue()
+    stop_queue = context.Queue()
+    users = context.Process(target=users_process, args=(args, port_queue, result_queue, stop_queue), daemon=True)
+    users.start()
+    port = port_queue.get()
+    
+    print(f"🚀 {args.users} users x {args.links} links against fake Bot API on port {port}...", file=sys.stderr)
+    
+    # Parser prints stats per upload, keep report readable
+    with open(os.devnull, 'w') as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            result = asyncio.run(run_bot(args, port, result_queue, stop_queue))
+        finally:
+            sys.stdout = stdout
+    users.join()
+    
+    # ru_maxrss is KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    
+    print(f"\n📊 Load test: {args.users} users, {args.links} links each")
+    print(f"✅ Completed: {result['completed']}  ❌ Timed out: {result['failed']}")
+    print(f"⏱️ Wall time: {result['elapsed']:.2f}s")
+    print(f"⚡ Throughput: {result['completed'] / result['elapsed']:.2f} conversions/s")
+    print(f"📤 Uploaded to Bot API: {result['bytes_uploaded'] / (1024 * 1024):.2f} MB")
+    print(f"🧠 Peak RSS (bot): {peak_rss:.1f} MB\n")
+    print(f"{'step':<10}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for step, _ in STEPS:
+        values = result['latencies'][step]
+        mean = statistics.fmean(values) if values else float('nan')
+        print(f"{step:<10}{percentile(values, 0.5) * 1000:>10.1f}{percentile(values, 0.99) * 1000:>10.1f}{mean * 1000:>10.1f}")
+    
+    bystanders_failed = args.bystanders - result['bystanders_answered']
+    if args.bystanders:
+        print(f"\n👀 Bystanders answered: {result['bystanders_answered']}/{args.bystanders}")
+        for step, _ in BYSTANDER_STEPS:
+            values = result['bystander_latencies'][step]
+            mean = statistics.fmean(values) if values else float('nan')
+            print(f"{step:<10}{percentile(values, 0.5) * 1000:>10.1f}{percentile(values, 0.99) * 1000:>10.1f}{mean * 1000:>10.1f}")
+    
+    return 0 if result['failed'] == 0 and bystanders_failed == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
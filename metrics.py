@@ -0,0 +1,189 @@
+"""
+Minimal Prometheus metrics (text exposition format) - no extra dependencies
+
+Metrics are plain module objects, updated from the bot's event loop and
+read by a small HTTP server thread:
+
+    REQUESTS = Counter('app_requests_total', 'Requests handled', labels=('handler',))
+    REQUESTS.inc(handler='start')
+    start_http_server(9100)
+"""
+import time
+import bisect
+import functools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# All created metrics, in creation order
+REGISTRY = []
+_lock = threading.Lock()
+
+def _escape(value):
+    """Escape label value for the text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    """Render {name="value",...} label block"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+class Metric:
+    """Base class - keeps one value per label combination"""
+    kind = 'untyped'
+    
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        REGISTRY.append(self)
+    
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labels)
+    
+    def samples(self):
+        """Yield (suffix, label values, extra label, value)"""
+        with _lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield '', key, None, value
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, key, extra)} {value}")
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """
+    Value that goes up and down
+    Pass `func` to compute the value when scraped instead of setting it
+    """
+    kind = 'gauge'
+    
+    def __init__(self, name, help_text, labels=(), func=None):
+        super().__init__(name, help_text, labels)
+        self.func = func
+    
+    def set(self, value, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+    
+    def samples(self):
+        if self.func is None:
+            yield from super().samples()
+            return
+        try:
+            value = self.func()
+        except Exception as e:
+            print(f"Metrics: {self.name} failed: {e}")
+            return
+        yield '', (), None, value
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets"""
+    kind = 'histogram'
+    
+    DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [count per bucket (+Inf last), sum, count]
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+    
+    def time(self, **labels):
+        """Context manager that observes elapsed seconds"""
+        return _Timer(self, labels)
+    
+    def samples(self):
+        with _lock:
+            items = [(key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                yield '_bucket', key, ('le', le), cumulative
+            yield '_sum', key, None, total
+            yield '_count', key, None, count
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+def timed(histogram, label='handler'):
+    """Decorator - observe latency of an async function, labelled by its name"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(**{label: func.__name__}):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def render():
+    """All metrics in Prometheus text format"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        # Scrapes are frequent, keep logs clean
+        pass
+
+def start_http_server(port, host='127.0.0.1'):
+    """Serve /metrics from a background thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,265 @@
+"""
+HTTP conversion API - TXT to password-protected HTML for other services
+
+Usage:
+    python server.py --port 8080
+    curl --data-binary @lectures.txt -o lectures.html \
+        "http://localhost:8080/convert?password=secret&batch_name=Maths&credit_name=@FR_SAMMM11"
+
+Endpoints:
+    POST /convert   TXT file as the body (UTF-8), settings in the query string:
+                    password (min 4 chars), credit_name, batch_name (default: batch).
+                    The HTML is streamed back with chunked transfer encoding
+                    while it is being rendered (HTTP/1.0 clients get it
+                    unchunked, ended by closing the connection). Errors are JSON {"error": ...}.
+                    X-Skipped-Lines (+ X-Skipped-Line-Numbers) counts lines
+                    skipped as too long, X-Parse-Stopped-At is set when the
+                    parser ran out of time.
+    GET  /health    200 while a conversion slot is free, 503 when all are busy,
+                    so a load balancer can send work to another instance
+
+Bodies over MAX_REQUEST_SIZE get 413. When MAX_CONCURRENT_CONVERSIONS are
+already running, new conversions get 503 with Retry-After right away
+instead of queueing. Conversion runs in threads, so one process uses about
+one CPU core: scale out with one instance per core behind a load balancer.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+from http import HTTPStatus
+from urllib.parse import parse_qs, quote, urlsplit
+
+from bot import parse_txt_content, encode_categories, iter_html, MAX_FILE_SIZE
+
+# Max TXT body in bytes
+MAX_REQUEST_SIZE = int(os.getenv('MAX_REQUEST_SIZE', MAX_FILE_SIZE))
+# Conversions running at once, more get 503
+MAX_CONCURRENT_CONVERSIONS = int(os.getenv('MAX_CONCURRENT_CONVERSIONS', 4))
+# Seconds to wait for request headers/body, and for an idle keep-alive connection
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', 30))
+MAX_HEADER_LINES = 100
+
+class HTTPError(Exception):
+    """Error answered with a JSON body, close=True when the request body was not read"""
+    def __init__(self, status, message, close=False, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.close = close
+        self.headers = headers or {}
+
+class ConversionServer:
+    """Minimal HTTP/1.1 server (keep-alive, chunked responses) on asyncio streams"""
+    
+    def __init__(self, max_concurrent=MAX_CONCURRENT_CONVERSIONS, max_request_size=MAX_REQUEST_SIZE):
+        self.max_request_size = max_request_size
+        self.slots = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+    
+    async def handle_connection(self, reader, writer):
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await asyncio.wait_for(self.read_head(reader), REQUEST_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if request is None:
+                    break
+                http_method, path, version, headers = request
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                
+                started = time.perf_counter()
+                try:
+                    status = await self.route(reader, writer, http_method, path, version, headers, keep_alive)
+                except HTTPError as e:
+                    status = e.status
+                    keep_alive = keep_alive and not e.close
+                    await self.send_json(writer, e.status, {'error': str(e)}, keep_alive, e.headers)
+                print(f"{http_method} {urlsplit(path).path} {status} {time.perf_counter() - started:.2f}s")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            # Response already started, cut the connection so the client sees it incomplete
+            print(f"Error while serving request: {e}")
+        finally:
+            writer.close()
+    
+    async def read_head(self, reader):
+        """Request line and headers, None when the client closed the connection"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            http_method, path, version = request_line.decode('latin-1').rstrip('\r\n').split(' ')
+        except ValueError:
+            return None
+        
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return http_method, path, version, headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return None
+    
+    async def route(self, reader, writer, http_method, path, version, headers, keep_alive):
+        url = urlsplit(path)
+        
+        if url.path == '/health':
+            if self.slots.locked():
+                raise HTTPError(503, "All conversion slots busy", headers={'Retry-After': '1'})
+            await self.send_json(writer, 200, {'status': 'ok', 'active': self.active}, keep_alive)
+            return 200
+        
+        if url.path != '/convert':
+            raise HTTPError(404, "Not found", close=True)
+        if http_method != 'POST':
+            raise HTTPError(405, "Use POST", close=True, headers={'Allow': 'POST'})
+        
+        settings = {key: values[0] for key, values in parse_qs(url.query).items()}
+        password = settings.get('password', '')
+        credit_name = settings.get('credit_name', '').strip()
+        batch_name = settings.get('batch_name', '').strip() or 'batch'
+        if len(password) < 4:
+            raise HTTPError(400, "password must be at least 4 characters", close=True)
+        if not credit_name:
+            raise HTTPError(400, "credit_name is required", close=True)
+        
+        # Checked before reading the body, so oversized uploads are never buffered
+        if 'content-length' not in headers:
+            raise HTTPError(411, "Content-Length required", close=True)
+        try:
+            size = int(headers['content-length'])
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length", close=True)
+        if size > self.max_request_size:
+            raise HTTPError(413, f"Body too large, max {self.max_request_size} bytes", close=True)
+        if self.slots.locked():
+            raise HTTPError(503, "All conversion slots busy, retry later", close=True, headers={'Retry-After': '1'})
+        
+        async with self.slots:
+            self.active += 1
+            try:
+                # HTTP/1.0 clients don't know 100 Continue
+                if version == 'HTTP/1.1' and headers.get('expect', '').lower() == '100-continue':
+                    writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                    await writer.drain()
+                try:
+                    body = await asyncio.wait_for(reader.readexactly(size), REQUEST_TIMEOUT)
+                except asyncio.TimeoutError:
+                    raise HTTPError(408, "Timed out reading body", close=True)
+                return await self.convert(writer, body, password, batch_name, credit_name, keep_alive, chunked=version == 'HTTP/1.1')
+            finally:
+                self.active -= 1
+    
+    async def convert(self, writer, body, password, batch_name, credit_name, keep_alive, chunked=True):
+        """
+        Parse the TXT body and stream the HTML as chunks
+        Without chunked (HTTP/1.0) the body is sent as is and ends when the connection closes
+        """
+        try:
+            content = body.decode('utf-8')
+        except UnicodeDecodeError:
+            raise HTTPError(400, "Body must be UTF-8 text")
+        
+        report = {}
+        categories = await asyncio.to_thread(parse_txt_content, content, report)
+        total = sum(len(items) for items in categories.values())
+        if total == 0:
+            raise HTTPError(422, "No valid content found!")
+        
+        encrypted_data = await asyncio.to_thread(encode_categories, categories, password)
+        chunks = iter_html(encrypted_data, password, batch_name, credit_name)
+        
+        filename = quote(f"{batch_name.replace(' ', '_')}.html")
+        headers = {
+            'Content-Type': 'text/html; charset=utf-8',
+            'Content-Disposition': f"attachment; filename*=UTF-8''{filename}",
+            'X-Items': str(total),
+            'X-Skipped-Lines': str(report['skipped']),
+        }
+        if report['skipped_lines']:
+            headers['X-Skipped-Line-Numbers'] = ','.join(map(str, report['skipped_lines']))
+        if report['stopped_at']:
+            headers['X-Parse-Stopped-At'] = str(report['stopped_at'])
+        if chunked:
+            headers['Transfer-Encoding'] = 'chunked'
+        else:
+            # Length is unknown until the end, so the connection close ends the body
+            keep_alive = False
+        self.write_head(writer, 200, headers, keep_alive)
+        
+        # Each piece is rendered in a thread, sent as soon as it is ready
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            data = chunk.encode('utf-8')
+            if chunked:
+                data = f"{len(data):X}\r\n".encode('latin-1') + data + b"\r\n"
+            writer.write(data)
+            await writer.drain()
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        return 200
+    
+    def write_head(self, writer, status, headers, keep_alive):
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    
+    async def send_json(self, writer, status, payload, keep_alive, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.write_head(writer, status, {
+            'Content-Type': 'application/json',
+            'Content-Length': str(len(body)),
+            **(headers or {}),
+        }, keep_alive)
+        writer.write(body)
+        await writer.drain()
+
+async def serve(host, port, max_concurrent, max_request_size):
+    conversion_server = ConversionServer(max_concurrent, max_request_size)
+    server = await asyncio.start_server(conversion_server.handle_connection, host, port)
+    print(f"🚀 Conversion API on http://{host}:{port} ({max_concurrent} concurrent, max {max_request_size} bytes)", file=sys.stderr)
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except NotImplementedError:
+            # Windows - Ctrl+C still raises KeyboardInterrupt
+            pass
+    await stop.wait()
+    
+    # Stop accepting, let running conversions finish
+    server.close()
+    deadline = time.monotonic() + REQUEST_TIMEOUT
+    while conversion_server.active and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    print("👋 Stopped", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP API converting TXT link files to password-protected HTML")
+    parser.add_argument('--host', default=os.getenv('SERVER_HOST', '0.0.0.0'), help="Listen address (default: 0.0.0.0)")
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 8080)), help="Listen port (default: $PORT or 8080)")
+    parser.add_argument('-j', '--max-concurrent', type=int, default=MAX_CONCURRENT_CONVERSIONS, help="Conversions at once, more get 503")
+    parser.add_argument('--max-size', type=int, default=MAX_REQUEST_SIZE, help="Max TXT body in bytes")
+    args = parser.parse_args(argv)
+    
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_concurrent, args.max_size))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Content-Type probing against a local stand-in HTTP server
+
+Usage:
+    python -m unittest test_probe
+"""
+import asyncio
+import unittest
+from unittest import mock
+
+import httpx
+
+import bot
+
+class StandInServer:
+    """HTTP/1.1 server on 127.0.0.1 answering probes by path, records every request"""
+    
+    ROUTES = {
+        '/video': (200, {'Content-Type': 'video/mp4'}),
+        '/sheet': (200, {'Content-Type': 'application/pdf'}),
+        '/redirect': (302, {'Location': '/video/file'}),
+    }
+    
+    def __init__(self):
+        self.requests = []
+    
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+    
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+    
+    def url(self, route, host='127.0.0.1'):
+        # Own folder per route, so every route is its own probe pattern
+        return f"http://{host}:{self.port}{route}/file"
+    
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ')
+                path = path.rsplit('/', 1)[0]
+                while (await reader.readline()) not in (b'\r\n', b''):
+                    pass
+                self.requests.append((method, path))
+                
+                if path == '/no-head' and method == 'HEAD':
+                    status, headers = 405, {}
+                elif path == '/no-head':
+                    status, headers = 206, {'Content-Type': 'image/png'}
+                else:
+                    status, headers = self.ROUTES.get(path, (404, {}))
+                
+                head = [f"HTTP/1.1 {status} X", "Content-Length: 0"]
+                head += [f"{name}: {value}" for name, value in headers.items()]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+                await writer.drain()
+        finally:
+            writer.close()
+
+def other_items(*links):
+    return {'Files': [{'title': f"File {index}", 'link': link, 'type': 'OTHER'} for index, link in enumerate(links)]}
+
+class ProbeTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        bot.probe_cache.clear()
+    
+    async def test_classifies_through_local_server(self):
+        async with StandInServer() as server:
+            categories = other_items(
+                server.url('/video'),
+                server.url('/sheet'),
+                server.url('/redirect'),
+                server.url('/no-head'),
+                server.url('/missing'),
+            )
+            # Caller's pooled client is used for every probe
+            with mock.patch.object(bot, 'PROBE_ALLOW_PRIVATE', True):
+                async with httpx.AsyncClient(timeout=2) as client:
+                    reclassified = await bot.probe_unclassified(categories, client)
+        
+        self.assertEqual(
+            [item['type'] for item in categories['Files']],
+            ['VIDEO', 'PDF', 'VIDEO', 'IMAGE', 'OTHER']
+        )
+        self.assertEqual(reclassified, 4)
+        # HEAD refused -> ranged GET
+        self.assertIn(('GET', '/no-head'), server.requests)
+    
+    async def test_refuses_private_targets(self):
+        async with StandInServer() as server:
+            categories = other_items(server.url('/video'), server.url('/video', host='localhost'))
+            await bot.probe_unclassified(categories)
+        
+        self.assertEqual([item['type'] for item in categories['Files']], ['OTHER', 'OTHER'])
+        self.assertEqual(server.requests, [])
+    
+    async def test_refuses_redirect_into_private_network(self):
+        async with StandInServer() as server:
+            checked = bot.resolve_public
+            
+            async def localhost_is_public(host, port):
+                # Stand-in for a public host: only the name 'localhost' passes
+                if host == 'localhost':
+                    return '127.0.0.1'
+                return await checked(host, port)
+            
+            server.ROUTES = {'/redirect': (302, {'Location': server.url('/video')})}
+            with mock.patch.object(bot, 'resolve_public', localhost_is_public):
+                categories = other_items(server.url('/redirect', host='localhost'))
+                await bot.probe_unclassified(categories)
+        
+        self.assertEqual(categories['Files'][0]['type'], 'OTHER')
+        # Redirect was read, its private target never requested
+        self.assertEqual(server.requests, [('HEAD', '/redirect')])
+    
+    async def test_private_addresses(self):
+        for host in ('127.0.0.1', '10.0.0.8', '192.168.1.1', '169.254.169.254', '::1', '::ffff:127.0.0.1', 'fe80::1'):
+            with self.subTest(host=host):
+                self.assertIsNone(await bot.resolve_public(host, 80))
+        self.assertEqual(await bot.resolve_public('93.184.215.14', 80), '93.184.215.14')
+
+if __name__ == '__main__':
+    unittest.main()